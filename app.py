@@ -1,7 +1,14 @@
 import streamlit as st
 import time
-from utils import extract_text, split_text
-from vectorstore import build_vectorstore
+from ingest import ingest_documents
+from ingest_cache import IngestCache
+from index_store import IndexStore, library_key
+from index_registry import index_registry
+from vectorstore import get_default_embeddings
+from quantization import EMBEDDING_TYPE
+from reduction import REDUCTION
+from index_factory import INDEX_TYPE
+from metrics import embedding_metrics
 from qa_chain import get_qa_chain
 from datetime import datetime, timedelta
 from functools import wraps
@@ -216,6 +223,26 @@ def timeout(seconds=30):
         return wrapper
     return decorator
 
+def close_library():
+    """Drop the session's reference to its shared document library."""
+    lease = st.session_state.pop("library_lease", None)
+    if lease is not None:
+        lease.release()
+    st.session_state.vectorstore = None
+    st.session_state.qa_chain = None
+
+def open_library(lease, names):
+    """Make a shared vector store the session's document library and start a new conversation."""
+    close_library()
+    st.session_state.library_lease = lease
+    st.session_state.vectorstore = lease.vectorstore
+    st.session_state.qa_chain = get_qa_chain(
+        vectorstore=lease.vectorstore,
+        detail_level='Normal'
+    )
+    st.session_state.library_names = names
+    st.session_state.messages = []
+
 # Page config
 st.set_page_config(
     page_title="Chat with Your Notes",
@@ -753,19 +780,53 @@ with st.sidebar:
                 st.session_state.chat_history[chat_id] = st.session_state.messages.copy()
                 st.session_state.current_chat = chat_id
         st.session_state.messages = []
-        st.session_state.qa_chain = None
+        close_library()
         st.session_state.last_uploaded = None
     
     st.markdown("---")
     
     # Document Upload Section
-    st.markdown("### Upload Document")
-    uploaded_file = st.file_uploader(
-        "Drag and drop a file here or click to browse",
-        type=["pdf", "txt", "docx", "pptx", "ppt", "xlsx", "xls"],
+    st.markdown("### Upload Documents")
+    uploaded_files = st.file_uploader(
+        "Drag and drop files here or click to browse",
+        type=["pdf", "txt", "md", "docx", "pptx", "ppt", "xlsx", "xls"],
+        accept_multiple_files=True,
         label_visibility="collapsed"
     )
     
+    # Libraries saved to disk can be reopened after a refresh, logout or restart
+    recent_libraries = IndexStore().recent(st.session_state.user)
+    if recent_libraries and not uploaded_files:
+        st.markdown("### Recent Documents")
+        for manifest in recent_libraries:
+            names = manifest["names"]
+            if st.button(", ".join(names), key=f"library_{manifest['key']}", use_container_width=True):
+                def load_library(key=manifest["key"]):
+                    vectorstore = IndexStore().load(key, get_default_embeddings())
+                    if vectorstore is None:
+                        raise ValueError("This library is no longer available. Please upload the documents again.")
+                    return vectorstore
+                try:
+                    # Attach to the copy other sessions already hold, if any
+                    open_library(index_registry.acquire(manifest["key"], load_library), names)
+                    st.session_state.last_uploaded = names
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+    
+    # Deduplication savings from the last ingest
+    ingest_stats = st.session_state.get("ingest_stats") or {}
+    if ingest_stats.get("index_entries_saved"):
+        st.caption(
+            f"Collapsed {ingest_stats['index_entries_saved']} duplicate chunks "
+            f"({ingest_stats['embedding_calls_saved']} embedding calls saved)"
+        )
+    
+    # Process-wide embedding latency, throughput and stage timings
+    if st.session_state.last_uploaded:
+        with st.expander("Embedding metrics"):
+            st.json(embedding_metrics.snapshot(), expanded=False)
+    
     # Sample Questions Section
     if st.session_state.last_uploaded:
         st.markdown("### Sample Questions")
@@ -792,14 +853,12 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
     
-    # Process uploaded file
-    if uploaded_file is not None and uploaded_file != st.session_state.get('last_uploaded'):
+    # Process uploaded files
+    if uploaded_files and uploaded_files != st.session_state.get('last_uploaded'):
             # Clear previous state
-            st.session_state.vectorstore = None
-            st.session_state.qa_chain = None
+            close_library()
             
-            # Get file extension and map to filetype
-            file_extension = uploaded_file.name.split('.')[-1].lower()
+            # Map file extensions to filetypes
             filetype_mapping = {
                 'pdf': 'pdf',
                 'docx': 'docx',
@@ -808,40 +867,58 @@ with st.sidebar:
                 'ppt': 'pptx',  # Handle both .ppt and .pptx
                 'xlsx': 'xlsx',   # Excel files
                 'xls': 'xls',     # Older Excel format
-                'txt': 'txt'
+                'txt': 'txt',
+                'md': 'md'        # Markdown is ingested as plain text
             }
             
-            if file_extension not in filetype_mapping:
-                raise ValueError(f"Unsupported file type: {file_extension}")
+            documents = []
+            for uploaded_file in uploaded_files:
+                file_extension = uploaded_file.name.split('.')[-1].lower()
+                if file_extension not in filetype_mapping:
+                    raise ValueError(f"Unsupported file type: {file_extension}")
+                documents.append((uploaded_file, filetype_mapping[file_extension]))
+            
+            file_names = ", ".join(f.name for f in uploaded_files)
             
             try:
-                text = extract_text(uploaded_file, filetype_mapping[file_extension])
-                docs = split_text(text)
-                st.session_state.vectorstore = build_vectorstore(docs)
-                st.session_state.qa_chain = get_qa_chain(
-                    vectorstore=st.session_state.vectorstore,
-                    detail_level='Normal'
-                )
-                st.session_state.last_uploaded = uploaded_file
-                st.session_state.messages = []
-                st.success(f"Document '{uploaded_file.name}' processed successfully!")
+                # Reopen the library from disk if these documents were ingested before
+                embeddings = get_default_embeddings()
+                model = getattr(embeddings, "model", type(embeddings).__name__)
+                key = library_key(documents, model, EMBEDDING_TYPE, REDUCTION, INDEX_TYPE)
+                index_store = IndexStore()
+                names = [f.name for f in uploaded_files]
+                ingest_stats = {}
+                
+                def build_library():
+                    vectorstore = index_store.load(key, embeddings)
+                    if vectorstore is None:
+                        vectorstore = ingest_documents(documents, embeddings=embeddings, cache=IngestCache(), stats=ingest_stats)
+                        index_store.save(key, vectorstore, names)
+                    return vectorstore
+                
+                # Sessions uploading the same documents share one read-only index
+                lease = index_registry.acquire(key, build_library)
+                index_store.remember(st.session_state.user, key)
+                st.session_state.ingest_stats = ingest_stats
+                open_library(lease, names)
+                st.session_state.last_uploaded = uploaded_files
+                st.success(f"Processed {len(uploaded_files)} document(s) successfully!")
                 
-                # Display the chat interface with the file name
+                # Display the chat interface with the file names
                 st.markdown("""
                     <div class="chat-header" style="background: #1e1e1e; padding: 1rem; border-radius: 12px; margin-bottom: 1.5rem;">
                         <h2 style="color: #ffffff; margin: 0; font-size: 1.25rem;">
-                            Chat with """ + uploaded_file.name + """
+                            Chat with """ + file_names + """
                         </h2>
                         <p style="color: #a0a0a0; margin: 0.5rem 0 0 0; font-size: 0.875rem;">
-                            Ask questions about the document above
+                            Ask questions about the documents above
                         </p>
                     </div>
                 """, unsafe_allow_html=True)
                 st.rerun()
             except Exception as e:
-                st.error(f"Error processing document: {str(e)}")
-                st.session_state.vectorstore = None
-                st.session_state.qa_chain = None
+                st.error(f"Error processing documents: {str(e)}")
+                close_library()
     
     st.markdown("---")
     
@@ -945,7 +1022,7 @@ if st.session_state.last_uploaded:
     # If a document is loaded, show the file name in the header
     st.markdown(f"""
         <div class="chat-header" style="background: rgba(0, 0, 0, 0.7); padding: 1.5rem; border-radius: 16px; margin-bottom: 2rem; backdrop-filter: blur(10px);">
-            <h2 style="color: white; margin: 0;">Chat with {st.session_state.last_uploaded.name}</h2>
+            <h2 style="color: white; margin: 0;">Chat with {", ".join(st.session_state.library_names)}</h2>
         </div>
     """, unsafe_allow_html=True)
 else:
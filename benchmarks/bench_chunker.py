@@ -0,0 +1,82 @@
+"""
+Compare split_spans against LangChain's RecursiveCharacterTextSplitter.
+
+Usage:
+    python benchmarks/bench_chunker.py [--sizes 1 4 16] [--repeat 3]
+
+Sizes are in MB of synthetic prose. Prints throughput for each splitter.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils import split_spans, CHUNK_SEPARATORS
+
+WORDS = [
+    "the", "model", "document", "retrieval", "index", "vector", "chunk", "query",
+    "embedding", "answer", "context", "page", "lecture", "student", "example", "result"
+]
+
+def make_text(size_mb: float, seed: int = 0) -> str:
+    """Generate roughly size_mb MB of prose with sentences, lines and paragraphs"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs = []
+    total = 0
+    while total < target:
+        lines = []
+        for _ in range(rng.randint(1, 4)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize()
+                for _ in range(rng.randint(1, 5))
+            ]
+            lines.append(". ".join(sentences) + ".")
+        paragraph = "\n".join(lines)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def best_of(repeat: int, func) -> float:
+    """Return the fastest of repeat timed runs of func"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Input sizes in MB")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    recursive = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        length_function=len,
+        separators=CHUNK_SEPARATORS + [""]
+    )
+    
+    print(f"{'size':>8} {'splitter':>12} {'chunks':>8} {'seconds':>9} {'MB/s':>8}")
+    for size in args.sizes:
+        text = make_text(size)
+        mb = len(text) / (1024 * 1024)
+        
+        spans = split_spans(text, args.chunk_size, args.chunk_overlap)
+        elapsed = best_of(args.repeat, lambda: split_spans(text, args.chunk_size, args.chunk_overlap))
+        print(f"{mb:>7.1f}M {'split_spans':>12} {len(spans):>8} {elapsed:>9.3f} {mb / elapsed:>8.1f}")
+        
+        chunks = recursive.split_text(text)
+        elapsed = best_of(args.repeat, lambda: recursive.split_text(text))
+        print(f"{mb:>7.1f}M {'recursive':>12} {len(chunks):>8} {elapsed:>9.3f} {mb / elapsed:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Benchmark the ingestion pipeline on synthetic documents, fully offline.
+
+Generates PDF, DOCX, PPTX and XLSX files of configurable size, runs each
+through extract_text, split_text and build_vectorstore (plus the streaming
+ingest_document pipeline) with the local "hashing" embeddings backend, and
+prints per-stage wall time, throughput and peak RSS as JSON.
+
+Usage:
+    python benchmarks/bench_ingest.py [--scale 1.0] [--types pdf docx] [--backend hashing] [--reduction pca] [--output results.json]
+
+--scale multiplies the default document sizes (200 PDF pages, 2,000 DOCX
+paragraphs, 200 slides, 20,000 spreadsheet rows).
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import threading
+import contextlib
+from typing import Dict, Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import Embeddings
+from utils import extract_text, split_text
+from vectorstore import build_vectorstore, create_embeddings, EMBEDDINGS_BACKENDS
+from ingest import ingest_document
+from reduction import ReducedFAISS, measure_recall
+
+WORDS = [
+    "the", "model", "document", "retrieval", "index", "vector", "chunk", "query",
+    "embedding", "answer", "context", "page", "lecture", "student", "example", "result",
+    "analysis", "method", "theory", "data", "system", "process", "value", "function"
+]
+
+DEFAULT_SIZES = {"pdf": 200, "docx": 2000, "pptx": 200, "xlsx": 20000}
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(2, 6)))
+
+def make_pdf(pages: int, rng: random.Random) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), "\n\n".join(paragraph(rng) for _ in range(4)), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def make_docx(paragraphs: int, rng: random.Random) -> bytes:
+    from docx import Document
+    doc = Document()
+    for _ in range(paragraphs):
+        doc.add_paragraph(paragraph(rng))
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def make_pptx(slides: int, rng: random.Random) -> bytes:
+    from pptx import Presentation
+    prs = Presentation()
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i + 1}: {sentence(rng)}"
+        slide.placeholders[1].text = "\n".join(sentence(rng) for _ in range(5))
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+def make_xlsx(rows: int, rng: random.Random) -> bytes:
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Data")
+    sheet.append(["id", "code", "description", "quantity", "price"])
+    for i in range(rows):
+        sheet.append([i, f"P-{rng.randint(10000, 99999)}", sentence(rng), rng.randint(1, 500), round(rng.uniform(1, 999), 2)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+GENERATORS = {"pdf": make_pdf, "docx": make_docx, "pptx": make_pptx, "xlsx": make_xlsx}
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+class PeakRssSampler:
+    """Track the peak RSS of the process while a block of code runs"""
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+    
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+def run_stage(name: str, func: Callable[[], Any], units: float, unit: str) -> Dict[str, Any]:
+    """Run one stage and return its result plus timing and memory metrics"""
+    start_rss = current_rss()
+    # Keep the pipeline's progress prints out of the JSON report
+    with PeakRssSampler() as sampler, contextlib.redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    return {
+        "result": result,
+        "metrics": {
+            "stage": name,
+            "seconds": round(elapsed, 4),
+            "throughput": round(units / elapsed, 2) if elapsed else None,
+            "throughput_unit": unit,
+            "peak_rss_mb": round(sampler.peak / 2 ** 20, 1),
+            "rss_growth_mb": round((sampler.peak - start_rss) / 2 ** 20, 1)
+        }
+    }
+
+def bench_file(filetype: str, size: int, embeddings: Embeddings, seed: int, reduction: str = "none") -> Dict[str, Any]:
+    """Generate one synthetic document and benchmark every stage on it"""
+    data = GENERATORS[filetype](size, random.Random(seed))
+    mb = len(data) / 2 ** 20
+    
+    extract = run_stage("extract_text", lambda: extract_text(io.BytesIO(data), filetype), mb, "MB/s")
+    text = extract["result"]
+    split = run_stage("split_text", lambda: split_text(text), len(text) / 2 ** 20, "MB text/s")
+    chunks = split["result"]
+    build = run_stage("build_vectorstore", lambda: build_vectorstore(chunks, embeddings, reduction=reduction), len(chunks), "chunks/s")
+    streamed = run_stage(
+        "ingest_document",
+        lambda: ingest_document(io.BytesIO(data), filetype, embeddings=embeddings, dedup=False, reduction=reduction),
+        mb,
+        "MB/s"
+    )
+    
+    result = {
+        "filetype": filetype,
+        "size": size,
+        "bytes": len(data),
+        "text_chars": len(text),
+        "chunks": len(chunks),
+        "stages": [stage["metrics"] for stage in (extract, split, build, streamed)]
+    }
+    if isinstance(build["result"], ReducedFAISS):
+        result["reduction"] = measure_recall(build["result"])
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--types", nargs="+", choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the default document sizes")
+    parser.add_argument("--backend", choices=sorted(EMBEDDINGS_BACKENDS), default="hashing", help="Embeddings backend")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Embedding dimensions (hashing backend)")
+    parser.add_argument("--reduction", choices=["none", "pca", "random"], default="none", help="Dimensionality reduction of stored vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    
+    options = {"dimensions": args.dimensions} if args.backend == "hashing" else {}
+    embeddings = create_embeddings(args.backend, **options)
+    results = []
+    for filetype in args.types:
+        size = max(1, int(DEFAULT_SIZES[filetype] * args.scale))
+        print(f"Benchmarking {filetype} ({size})...", file=sys.stderr)
+        results.append(bench_file(filetype, size, embeddings, args.seed, args.reduction))
+    
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "embedder": embeddings.model,
+        "scale": args.scale,
+        "reduction": args.reduction,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results
+    }
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
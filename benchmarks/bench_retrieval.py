@@ -0,0 +1,155 @@
+"""
+Measure the latency and redundancy of MMR retrieval against plain top-k, fully offline.
+
+Builds a vector store from synthetic prose chunked with the default
+overlap, embeds a set of queries up front (MMR makes no extra embedding
+calls, so embedding time is the same for both), then times top-k search
+and MMR search per query, document lookups included. For each MMR lambda
+it reports the median and p95 latency, the overhead over top-k, the mean
+pairwise cosine similarity of the returned chunks and how many returned
+pairs are overlapping neighbours (consecutive chunks) as JSON.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--chunks 5000] [--lambdas 0.3 0.5 0.7] [--embedding-type int8] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import contextlib
+from typing import List, Dict, Any, Callable
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import split_text
+from vectorstore import build_vectorstore, create_embeddings
+from retrievers import search_ids, mmr_search_ids, stored_vectors, MMR_FETCH_K
+
+WORDS = [
+    "the", "model", "document", "retrieval", "index", "vector", "chunk", "query",
+    "embedding", "answer", "context", "page", "lecture", "student", "example", "result",
+    "analysis", "method", "theory", "data", "system", "process", "value", "function"
+]
+
+def make_text(chunks: int, chunk_size: int, rng: random.Random) -> str:
+    """Generate prose long enough to split into roughly the requested number of chunks"""
+    target = chunks * chunk_size
+    paragraphs = []
+    total = 0
+    while total < target:
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+            for _ in range(rng.randint(3, 8))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def time_queries(search: Callable[[List[float]], Any], queries: List[List[float]], repeat: int) -> List[float]:
+    """Return the fastest of repeat runs of search for each query, in milliseconds"""
+    timings = []
+    for query in queries:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            search(query)
+            best = min(best, time.perf_counter() - start)
+        timings.append(best * 1000)
+    return timings
+
+def redundancy(vectorstore, positions: np.ndarray) -> Dict[str, float]:
+    """Mean pairwise cosine similarity and number of consecutive-chunk pairs in one result set"""
+    if len(positions) < 2:
+        return {"similarity": 0.0, "neighbour_pairs": 0}
+    vectors = stored_vectors(vectorstore, positions)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    pairs = np.triu_indices(len(positions), 1)
+    # build_vectorstore numbers chunks in document order, as index positions
+    chunks = np.sort(positions)
+    return {
+        "similarity": float(similarity[pairs].mean()),
+        "neighbour_pairs": int((np.diff(chunks) == 1).sum())
+    }
+
+def summarize(timings: List[float], baseline: List[float], results: List[Dict[str, float]]) -> Dict[str, Any]:
+    median = float(np.median(timings))
+    baseline_median = float(np.median(baseline))
+    return {
+        "p50_ms": round(median, 4),
+        "p95_ms": round(float(np.percentile(timings, 95)), 4),
+        "overhead_ms": round(median - baseline_median, 4),
+        "overhead_pct": round((median - baseline_median) / baseline_median * 100, 1) if baseline_median else None,
+        "mean_pairwise_similarity": round(float(np.mean([r["similarity"] for r in results])), 4),
+        "neighbour_pairs_per_query": round(float(np.mean([r["neighbour_pairs"] for r in results])), 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="Approximate number of chunks in the store")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=MMR_FETCH_K)
+    parser.add_argument("--lambdas", type=float, nargs="+", default=[0.3, 0.5, 0.7, 1.0])
+    parser.add_argument("--embedding-type", choices=["float", "int8", "binary"], default="float")
+    parser.add_argument("--reduction", choices=["none", "pca", "random"], default="none")
+    parser.add_argument("--index-type", choices=["flat", "ivf", "hnsw", "auto"], default="flat")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Embedding dimensions (hashing backend)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    embeddings = create_embeddings("hashing", dimensions=args.dimensions)
+    chunks = split_text(make_text(args.chunks, 1000, rng))
+    # Keep the pipeline's progress prints out of the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        vectorstore = build_vectorstore(chunks, embeddings, args.embedding_type, args.reduction, args.index_type)
+    
+    # Queries are sentences taken from the chunks, embedded before timing
+    texts = [rng.choice(rng.choice(chunks).split(". ")) for _ in range(args.queries)]
+    queries = embeddings.embed_documents(texts)
+    
+    def lookup(positions: np.ndarray) -> list:
+        return [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            for position in positions.tolist()
+        ]
+    
+    topk = time_queries(lambda query: lookup(search_ids(vectorstore, query, args.k)), queries, args.repeat)
+    modes = {"top-k": summarize(topk, topk, [redundancy(vectorstore, search_ids(vectorstore, q, args.k)) for q in queries])}
+    for lambda_mult in args.lambdas:
+        def search(query: List[float]) -> np.ndarray:
+            return mmr_search_ids(vectorstore, query, args.k, args.fetch_k, lambda_mult)
+        timings = time_queries(lambda query: lookup(search(query)), queries, args.repeat)
+        modes[f"mmr lambda={lambda_mult}"] = summarize(timings, topk, [redundancy(vectorstore, search(q)) for q in queries])
+    
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "embedder": embeddings.model,
+        "chunks": vectorstore.index.ntotal,
+        "index": type(vectorstore.index).__name__,
+        "embedding_type": args.embedding_type,
+        "reduction": args.reduction,
+        "k": args.k,
+        "fetch_k": args.fetch_k,
+        "queries": args.queries,
+        "modes": modes
+    }
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import re
+import hashlib
+from functools import lru_cache
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable, Optional, Sequence
+import numpy as np
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+
+# Query terms found in more than this fraction of chunks are skipped (their
+# IDF is near zero but their posting lists are the longest to scan) unless
+# the query has no rarer term
+BM25_MAX_DF = float(os.getenv("BM25_MAX_DF", 0.5))
+
+# Saved as bm25_<array>.npy next to the FAISS index
+_BM25_PREFIX = "bm25_"
+_ARRAYS = ("terms", "offsets", "postings", "frequencies", "lengths", "weights")
+
+# Words, plus identifiers joined by -, ., / or _ (part numbers, codes, versions)
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_WORD = re.compile(r"[^\W_]+")
+
+@lru_cache(maxsize=1 << 18)
+def _term_hash(term: str) -> int:
+    """Stable 64-bit hash of a term (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms for BM25.
+    
+    Compound identifiers such as "AB-1234.5" are kept whole and also
+    split into their parts, so both the exact code and its pieces match.
+    """
+    terms = _TOKEN.findall(text.lower())
+    for token in [token for token in terms if not token.isalnum()]:
+        terms.extend(_WORD.findall(token))
+    return terms
+
+class BM25Index:
+    """
+    Okapi BM25 index over chunk texts with array-backed posting lists.
+    
+    Terms are stored as sorted 64-bit hashes, and their postings as one
+    CSR layout: offsets[i]:offsets[i + 1] slices the chunk positions and
+    term frequencies of terms[i]. There are no per-term Python objects,
+    so the index is compact, saves as plain .npy files and can be
+    memory-mapped. Each posting's BM25 contribution is precomputed, so a
+    query only sums slices of one weights array. Chunk positions are the
+    positions of the FAISS index it is built alongside.
+    """
+    
+    def __init__(
+        self,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+        weights: Optional[np.ndarray] = None,
+        k1: float = BM25_K1,
+        b: float = BM25_B
+    ):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        
+        if weights is None:
+            count = len(lengths)
+            document_frequency = np.diff(offsets).astype(np.float32)
+            idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5))
+            average_length = float(lengths.mean()) if count else 0.0
+            norms = k1 * (1 - b + b * lengths / (average_length or 1))
+            posting_idf = np.repeat(idf, np.diff(offsets))
+            weights = (posting_idf * frequencies * (k1 + 1) / (frequencies + norms[postings])).astype(np.float32)
+        self.weights = weights
+    
+    def __len__(self) -> int:
+        return len(self.lengths)
+    
+    @classmethod
+    def _from_postings(
+        cls,
+        hashes: np.ndarray,
+        documents: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray
+    ) -> "BM25Index":
+        """Build the CSR layout from one (term hash, chunk, frequency) triple per posting"""
+        terms, term_ids = np.unique(hashes, return_inverse=True)
+        order = np.lexsort((documents, term_ids))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        return cls(
+            terms,
+            offsets,
+            documents[order].astype(np.int32),
+            frequencies[order].astype(np.float32),
+            lengths.astype(np.int32)
+        )
+    
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "BM25Index":
+        """Build an index with one entry per text, in order"""
+        vocabulary: Dict[str, int] = {}
+        term_ids: List[int] = []
+        documents: List[int] = []
+        frequencies: List[int] = []
+        lengths: List[int] = []
+        for position, text in enumerate(texts):
+            terms = tokenize(text)
+            counts = Counter(terms)
+            term_ids.extend([vocabulary.setdefault(term, len(vocabulary)) for term in counts])
+            documents.extend([position] * len(counts))
+            frequencies.extend(counts.values())
+            lengths.append(len(terms))
+        # Hash each distinct term once
+        hashes = np.array([_term_hash(term) for term in vocabulary], dtype=np.uint64)
+        return cls._from_postings(
+            hashes[np.array(term_ids, dtype=np.int64)],
+            np.array(documents, dtype=np.int32),
+            np.array(frequencies, dtype=np.float32),
+            np.array(lengths, dtype=np.int32)
+        )
+    
+    @classmethod
+    def merge_all(cls, indexes: Sequence["BM25Index"]) -> "BM25Index":
+        """
+        Return an index over the chunks of all indexes, in order.
+        
+        The postings of every index are concatenated and the CSR layout is
+        built once, so merging many per-file indexes costs one sort of the
+        combined postings rather than one per pairwise merge.
+        """
+        starts = np.cumsum([0] + [len(index) for index in indexes[:-1]])
+        return cls._from_postings(
+            np.concatenate([np.repeat(index.terms, np.diff(index.offsets)) for index in indexes]),
+            np.concatenate([index.postings + start for index, start in zip(indexes, starts)]),
+            np.concatenate([index.frequencies for index in indexes]),
+            np.concatenate([index.lengths for index in indexes])
+        )
+    
+    def merge(self, other: "BM25Index") -> "BM25Index":
+        """Return an index over this index's chunks followed by other's"""
+        return BM25Index.merge_all([self, other])
+    
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the k chunks with the highest BM25 score for query.
+        
+        Only the postings of the query's terms are read.
+        
+        Args:
+            query: Query text
+            k: Maximum number of results
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Scores and chunk positions, best
+                first; chunks sharing no term with the query are left out
+        """
+        hashes = np.unique(np.array([_term_hash(term) for term in tokenize(query)], dtype=np.uint64))
+        slots = np.searchsorted(self.terms, hashes)
+        found = slots < len(self.terms)
+        slots, hashes = slots[found], hashes[found]
+        slots = slots[self.terms[slots] == hashes]
+        if not len(slots):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        
+        starts, ends = self.offsets[slots], self.offsets[slots + 1]
+        rare = ends - starts <= BM25_MAX_DF * len(self)
+        if rare.any():
+            starts, ends = starts[rare], ends[rare]
+        
+        # Postings of one term are unique, so fancy-indexed += is safe
+        scores = np.zeros(len(self), dtype=np.float32)
+        for start, end in zip(starts, ends):
+            scores[self.postings[start:end]] += self.weights[start:end]
+        candidates = np.flatnonzero(scores)
+        totals = scores[candidates]
+        
+        if len(candidates) > k:
+            top = np.argpartition(-totals, k - 1)[:k]
+            candidates, totals = candidates[top], totals[top]
+        order = np.argsort(-totals, kind="stable")
+        return totals[order], candidates[order].astype(np.int64)
+    
+    def save(self, folder_path: str) -> None:
+        """Save the index arrays to folder_path"""
+        os.makedirs(folder_path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(folder_path, f"{_BM25_PREFIX}{name}.npy"), getattr(self, name))
+    
+    @classmethod
+    def load(cls, folder_path: str, mmap: bool = False) -> Optional["BM25Index"]:
+        """Load the index saved in folder_path, memory-mapped if requested; None if there is none"""
+        paths = [os.path.join(folder_path, f"{_BM25_PREFIX}{name}.npy") for name in _ARRAYS]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        arrays = [np.load(path, mmap_mode="r" if mmap else None) for path in paths]
+        return cls(*arrays)
@@ -0,0 +1,258 @@
+from typing import List, Dict, Any, Optional, Union, Sequence
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# Metadata keys stored as integer columns; -1 marks a missing value
+INT_COLUMNS = ("page", "sheet", "char_start", "char_end")
+
+_SOURCE_PREFIX = "chunk-"
+
+def _grow(array: np.ndarray, length: int) -> np.ndarray:
+    """Return array with room for length entries, at least doubling it when it is too small"""
+    if len(array) >= length:
+        return array
+    grown = np.empty(max(length, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """
+    Docstore that keeps chunks in columns instead of Document objects.
+    
+    All chunk texts live in one UTF-8 buffer, sliced by an offsets array
+    (one str would widen to 4 bytes per character as soon as a single chunk
+    held an emoji or CJK text). The provenance metadata written at ingest
+    is kept in integer arrays: file (an index into the list of file names),
+    chunk number (the N of the "chunk-N" source), page or slide number,
+    sheet and character range in the extracted text. Any other metadata
+    (e.g. the "duplicates" list of a deduplicated chunk) goes into a sparse
+    per-row dict. Documents are built on demand by search(), so memory per
+    chunk is the text plus a few dozen bytes, and the store pickles
+    quickly.
+    
+    The buffer and arrays grow geometrically, so adding rows (or merging
+    many stores with extend) costs time proportional to the rows added,
+    not to the size of the store.
+    
+    Returned Documents are fresh copies: modifying their metadata does not
+    change the store (use set_file to relabel chunks).
+    """
+    
+    def __init__(self):
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._text = bytearray()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._files: List[str] = []
+        self._file = np.empty(0, dtype=np.int32)
+        self._chunk = np.empty(0, dtype=np.int32)
+        self._columns = {name: np.empty(0, dtype=np.int64) for name in INT_COLUMNS}
+        self._extra: Dict[int, Dict[str, Any]] = {}
+    
+    @classmethod
+    def from_texts(
+        cls,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]]
+    ) -> "ColumnarDocstore":
+        """Build a docstore holding one row per (id, text, metadata)"""
+        docstore = cls()
+        docstore._append(ids, texts, metadatas)
+        return docstore
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Leave the spare capacity of the arrays out of the pickle
+        size = len(self._ids)
+        state = self.__dict__.copy()
+        state["_offsets"] = self._offsets[:size + 1].copy()
+        state["_file"] = self._file[:size].copy()
+        state["_chunk"] = self._chunk[:size].copy()
+        state["_columns"] = {name: array[:size].copy() for name, array in self._columns.items()}
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Stores pickled before the buffer became a bytearray or had every column
+        self._text = bytearray(self._text)
+        for name in INT_COLUMNS:
+            if name not in self._columns:
+                self._columns[name] = np.full(len(self._ids), -1, dtype=np.int64)
+    
+    def _file_code(self, name: Optional[str]) -> int:
+        if name is None:
+            return -1
+        try:
+            return self._files.index(name)
+        except ValueError:
+            self._files.append(name)
+            return len(self._files) - 1
+    
+    def _append(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        # Check only the incoming ids, not every stored one
+        overlapping = {doc_id for doc_id in ids if doc_id in self._rows}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        
+        first = len(self._ids)
+        last = first + len(ids)
+        self._reserve(last)
+        for row, metadata in enumerate(metadatas, start=first):
+            metadata = dict(metadata)
+            self._file[row] = self._file_code(metadata.pop("file", None))
+            source = metadata.get("source")
+            chunk = -1
+            if isinstance(source, str) and source.startswith(_SOURCE_PREFIX) and source[len(_SOURCE_PREFIX):].isdigit():
+                chunk = int(source[len(_SOURCE_PREFIX):])
+                del metadata["source"]
+            self._chunk[row] = chunk
+            for name in INT_COLUMNS:
+                value = metadata.get(name)
+                if isinstance(value, int) and value >= 0:
+                    del metadata[name]
+                    self._columns[name][row] = value
+                else:
+                    self._columns[name][row] = -1
+            if metadata:
+                self._extra[row] = metadata
+        
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(text) for text in encoded), dtype=np.int64, count=len(encoded))
+        self._offsets[first + 1:last + 1] = self._offsets[first] + np.cumsum(lengths)
+        self._text += b"".join(encoded)
+        self._ids.extend(ids)
+        self._rows.update((doc_id, first + row) for row, doc_id in enumerate(ids))
+    
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Add Documents keyed by id (used by FAISS.merge_from)"""
+        self._append(
+            list(texts),
+            [doc.page_content for doc in texts.values()],
+            [doc.metadata for doc in texts.values()]
+        )
+    
+    def extend(self, other: "ColumnarDocstore") -> None:
+        """Append every row of another columnar docstore without building Documents"""
+        overlapping = {doc_id for doc_id in other._rows if doc_id in self._rows}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        
+        first = len(self._ids)
+        last = first + len(other._ids)
+        self._reserve(last)
+        codes = np.array([self._file_code(name) for name in other._files] + [-1], dtype=np.int32)
+        self._offsets[first + 1:last + 1] = self._offsets[first] + other._offsets[1:len(other._ids) + 1]
+        self._text += other._text
+        # Code -1 indexes the trailing -1 entry
+        self._file[first:last] = codes[other._file[:len(other._ids)]]
+        self._chunk[first:last] = other._chunk[:len(other._ids)]
+        for name in INT_COLUMNS:
+            self._columns[name][first:last] = other._columns[name][:len(other._ids)]
+        self._extra.update((first + row, dict(extra)) for row, extra in other._extra.items())
+        self._ids.extend(other._ids)
+        self._rows.update((doc_id, first + row) for row, doc_id in enumerate(other._ids))
+    
+    def _reserve(self, size: int) -> None:
+        """Make room for size rows in every array"""
+        self._offsets = _grow(self._offsets, size + 1)
+        self._file = _grow(self._file, size)
+        self._chunk = _grow(self._chunk, size)
+        for name in INT_COLUMNS:
+            self._columns[name] = _grow(self._columns[name], size)
+    
+    def row(self, doc_id: str) -> Optional[int]:
+        """Return the row of a document id, or None if it is not stored"""
+        return self._rows.get(doc_id)
+    
+    def text(self, row: int) -> str:
+        """Return the text of a row"""
+        return self._text[self._offsets[row]:self._offsets[row + 1]].decode("utf-8")
+    
+    def provenance(self, doc_id: str) -> Dict[str, Any]:
+        """
+        Return where a chunk came from, in O(1).
+        
+        Args:
+            doc_id: Document id
+        
+        Returns:
+            Dict[str, Any]: "file", "chunk", "page", "sheet", "char_start"
+                and "char_end"; missing values are None. "page" is the
+                page or slide number (PDF, PPTX) and "sheet" the sheet
+                index (XLSX, XLS)
+        
+        Raises:
+            KeyError: If doc_id is not stored
+        """
+        row = self._rows[doc_id]
+        file = int(self._file[row])
+        chunk = int(self._chunk[row])
+        provenance: Dict[str, Any] = {
+            "file": self._files[file] if file >= 0 else None,
+            "chunk": chunk if chunk >= 0 else None
+        }
+        for name in INT_COLUMNS:
+            value = int(self._columns[name][row])
+            provenance[name] = value if value >= 0 else None
+        return provenance
+    
+    def column(self, name: str) -> np.ndarray:
+        """
+        Return a metadata column as a read-only array, one value per row.
+        
+        Args:
+            name: "file" (codes into files()), "chunk" or one of INT_COLUMNS
+        
+        Returns:
+            np.ndarray: The column; -1 marks missing values
+        """
+        array = {"file": self._file, "chunk": self._chunk}.get(name)
+        if array is None:
+            array = self._columns[name]
+        view = array[:len(self._ids)]
+        view.flags.writeable = False
+        return view
+    
+    def files(self) -> List[str]:
+        """Return the file names referenced by the "file" column codes"""
+        return list(self._files)
+    
+    def set_file(self, name: Optional[str]) -> None:
+        """Set the file of every row to name (None clears it)"""
+        self._files = [] if name is None else [name]
+        self._file = np.full(len(self._ids), 0 if name is not None else -1, dtype=np.int32)
+    
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Build the Document stored under an id.
+        
+        Args:
+            search: Document id
+        
+        Returns:
+            Union[str, Document]: The Document, or an error message if the
+                id is not stored (as InMemoryDocstore does)
+        """
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        
+        metadata: Dict[str, Any] = {}
+        chunk = int(self._chunk[row])
+        if chunk >= 0:
+            metadata["source"] = f"{_SOURCE_PREFIX}{chunk}"
+        file = int(self._file[row])
+        if file >= 0:
+            metadata["file"] = self._files[file]
+        for name in INT_COLUMNS:
+            value = int(self._columns[name][row])
+            if value >= 0:
+                metadata[name] = value
+        extra = self._extra.get(row)
+        if extra:
+            metadata.update(extra)
+        return Document(page_content=self.text(row), metadata=metadata)
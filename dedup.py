@@ -0,0 +1,154 @@
+import re
+import hashlib
+import numpy as np
+from typing import List, Dict, Tuple, Optional
+
+# Chunks whose SimHashes differ in at most this many bits are near-duplicates
+# (when near-duplicate detection is enabled; at most 3, see _BANDS)
+SIMHASH_MAX_DISTANCE = 2
+
+# Chunks with fewer shingles than this are only matched exactly
+SIMHASH_MIN_SHINGLES = 8
+
+# Number of 16-bit bands used to find SimHash candidates; with 4 bands any
+# two hashes within 3 bits of each other share at least one band exactly
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_WORD = re.compile(r"\w+")
+
+# Words containing a digit: IDs, part numbers, versions, amounts
+_CODE = re.compile(r"\w*\d\w*")
+
+def normalize(text: str) -> str:
+    """Lowercase text and collapse runs of whitespace"""
+    return " ".join(text.lower().split())
+
+def code_digest(text: str) -> bytes:
+    """Hash the set of digit-bearing words in text (IDs, numbers, versions)"""
+    codes = sorted(set(_CODE.findall(text.lower())))
+    return hashlib.blake2b(" ".join(codes).encode("utf-8"), digest_size=8).digest()
+
+def simhash(text: str, shingle_size: int = 3) -> Optional[int]:
+    """
+    Compute a 64-bit SimHash of text over word shingles.
+    
+    Args:
+        text: The text to hash
+        shingle_size: Number of consecutive words per shingle
+    
+    Returns:
+        Optional[int]: The SimHash, or None if the text has fewer than
+            SIMHASH_MIN_SHINGLES distinct shingles
+    """
+    words = _WORD.findall(text.lower())
+    # Count each distinct shingle once so repeated phrases don't dominate
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    shingle_count = len(shingles)
+    if shingle_count < SIMHASH_MIN_SHINGLES:
+        return None
+    
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for shingle in shingles
+    )
+    # One row of 64 bits per shingle; each output bit is a majority vote
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0) * 2 > shingle_count
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0])
+
+class ChunkDeduplicator:
+    """
+    Detect exact and, optionally, near-duplicate chunks before they are embedded.
+    
+    Exact duplicates are found by hashing the normalized text. With near
+    enabled, near duplicates are found by comparing SimHashes, using banded
+    lookup tables so each chunk is only compared with plausible candidates.
+    A near duplicate must also contain exactly the same digit-bearing words,
+    so chunks that differ only in an ID, a part number or an amount stay
+    separately searchable. Chunks are fed in one at a time, so the
+    deduplicator works on a stream.
+    """
+    
+    def __init__(self, near: bool = False, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.near = near
+        self.max_distance = max_distance
+        self._exact: Dict[bytes, int] = {}
+        self._simhashes: List[Optional[int]] = []
+        self._codes: List[bytes] = []
+        self._bands: Dict[Tuple[int, int], List[int]] = {}
+        self.stats = {"chunks": 0, "unique": 0, "exact_duplicates": 0, "near_duplicates": 0}
+    
+    def add(self, text: str) -> Tuple[int, bool]:
+        """
+        Register a chunk.
+        
+        Args:
+            text: Chunk text
+        
+        Returns:
+            Tuple[int, bool]: Index of the unique chunk this chunk maps to,
+                and whether it is new (i.e. needs to be embedded)
+        """
+        self.stats["chunks"] += 1
+        
+        digest = hashlib.sha1(normalize(text).encode("utf-8")).digest()
+        if digest in self._exact:
+            self.stats["exact_duplicates"] += 1
+            return self._exact[digest], False
+        
+        fingerprint = simhash(text) if self.near else None
+        codes = code_digest(text) if fingerprint is not None else b""
+        if fingerprint is not None:
+            match = self._find_near(fingerprint, codes)
+            if match is not None:
+                self._exact[digest] = match
+                self.stats["near_duplicates"] += 1
+                return match, False
+        
+        index = len(self._simhashes)
+        self._exact[digest] = index
+        self._simhashes.append(fingerprint)
+        self._codes.append(codes)
+        if fingerprint is not None:
+            for band in range(_BANDS):
+                key = (band, fingerprint >> (band * _BAND_BITS) & _BAND_MASK)
+                self._bands.setdefault(key, []).append(index)
+        self.stats["unique"] += 1
+        return index, True
+    
+    def _find_near(self, fingerprint: int, codes: bytes) -> Optional[int]:
+        """Return the first unique chunk within max_distance bits of fingerprint with the same codes"""
+        for band in range(_BANDS):
+            key = (band, fingerprint >> (band * _BAND_BITS) & _BAND_MASK)
+            for index in self._bands.get(key, ()):
+                if (self._simhashes[index] ^ fingerprint).bit_count() <= self.max_distance and self._codes[index] == codes:
+                    return index
+        return None
+
+def dedup_chunks(chunks: List[str], near: bool = False) -> Tuple[List[str], List[List[int]], Dict[str, int]]:
+    """
+    Collapse exact and, optionally, near-duplicate chunks.
+    
+    Args:
+        chunks: Text chunks, e.g. from split_text
+        near: Whether to also collapse near duplicates
+    
+    Returns:
+        Tuple[List[str], List[List[int]], Dict[str, int]]: The unique chunks,
+            the positions in chunks that each unique chunk stands for, and
+            deduplication stats
+    """
+    deduplicator = ChunkDeduplicator(near)
+    unique: List[str] = []
+    positions: List[List[int]] = []
+    
+    for position, chunk in enumerate(chunks):
+        index, is_new = deduplicator.add(chunk)
+        if is_new:
+            unique.append(chunk)
+            positions.append([])
+        positions[index].append(position)
+    
+    return unique, positions, deduplicator.stats
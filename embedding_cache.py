@@ -0,0 +1,207 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import List, Dict, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from quantization import EMBEDDING_DTYPES, quantize
+from metrics import embedding_metrics
+from embedding_control import embedding_controller
+
+logger = logging.getLogger(__name__)
+
+# Persistent embedding cache settings
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".embedding_cache.sqlite3")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", 500_000))
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent embedding cache in front of another Embeddings instance.
+    
+    Vectors are stored as raw blobs (float32, int8 or packed binary) in
+    SQLite, keyed by a hash of (model, input_type, text), so identical chunks across re-uploads,
+    edited files and different users are only sent to the API once. When
+    the cache holds more than max_entries vectors, the least recently used
+    ones are deleted.
+    """
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str = EMBED_CACHE_PATH,
+        max_entries: int = EMBED_CACHE_MAX_ENTRIES
+    ):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def _key(self, input_type: str, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{input_type}\0{text}".encode("utf-8")).digest()
+    
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        """Fetch cached vectors for keys and mark them as recently used"""
+        found: Dict[bytes, bytes] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _MAX_PARAMS):
+                part = keys[i:i + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            self._conn.commit()
+        return found
+    
+    def _store(self, items: Dict[bytes, bytes]) -> None:
+        """Insert new vectors, then evict the least recently used beyond max_entries"""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, vector, now) for key, vector in items.items()]
+            )
+            self._count += self._conn.total_changes - before
+            
+            excess = self._count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                logger.info(f"Evicted {excess} cached embeddings")
+            self._conn.commit()
+    
+    @property
+    def embedding_types(self) -> Tuple[str, ...]:
+        """Embedding types served from the cache; the same as the wrapped embedder's"""
+        return getattr(self.embeddings, "embedding_types", ("float",))
+    
+    def _partition(self, texts: List[str], input_type: str) -> Tuple[List[bytes], Dict[bytes, bytes], Dict[bytes, str]]:
+        """Split texts into cached vectors and the distinct texts that still need embedding"""
+        keys = [self._key(input_type, text) for text in texts]
+        found = self._lookup(keys)
+        
+        # Embed each distinct missing text once
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        embedding_metrics.increment("cache_hits", len(texts) - len(missing))
+        embedding_metrics.increment("cache_misses", len(missing))
+        return keys, found, missing
+    
+    def _complete(
+        self,
+        keys: List[bytes],
+        found: Dict[bytes, bytes],
+        missing: Dict[bytes, str],
+        vectors: np.ndarray,
+        dtype
+    ) -> np.ndarray:
+        """Store freshly embedded vectors and assemble the result in input order"""
+        if missing:
+            vectors = np.asarray(vectors, dtype=dtype)
+            new = {key: vector.tobytes() for key, vector in zip(missing, vectors)}
+            self._store(new)
+            found.update(new)
+        return np.stack([np.frombuffer(found[key], dtype=dtype) for key in keys])
+    
+    @staticmethod
+    def _input_type(embedding_type: str) -> str:
+        if embedding_type == "float":
+            return "search_document"
+        return f"search_document:{embedding_type}"
+    
+    def embed_documents_array(self, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+        """Embed documents as an array of the given embedding type, serving previously seen texts from the cache"""
+        if embedding_type != "float" and embedding_type not in self.embedding_types:
+            # Compress the (cached) float vectors locally
+            return quantize(self.embed_documents_array(texts), embedding_type)
+        
+        dtype = EMBEDDING_DTYPES[embedding_type]
+        keys, found, missing = self._partition(texts, self._input_type(embedding_type))
+        vectors = None
+        if missing:
+            batch = list(missing.values())
+            if embedding_type != "float":
+                vectors = self.embeddings.embed_documents_array(batch, embedding_type)
+            elif hasattr(self.embeddings, "embed_documents_array"):
+                vectors = self.embeddings.embed_documents_array(batch)
+            else:
+                vectors = self.embeddings.embed_documents(batch)
+        return self._complete(keys, found, missing, vectors, dtype)
+    
+    async def aembed_documents_array(self, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+        """Async counterpart of embed_documents_array; misses are embedded with the wrapped embedder's async API"""
+        if embedding_type != "float" and embedding_type not in self.embedding_types:
+            return quantize(await self.aembed_documents_array(texts), embedding_type)
+        
+        dtype = EMBEDDING_DTYPES[embedding_type]
+        keys, found, missing = self._partition(texts, self._input_type(embedding_type))
+        vectors = None
+        if missing:
+            batch = list(missing.values())
+            if embedding_type != "float":
+                vectors = await self.embeddings.aembed_documents_array(batch, embedding_type)
+            elif hasattr(self.embeddings, "aembed_documents_array"):
+                vectors = await self.embeddings.aembed_documents_array(batch)
+            else:
+                vectors = await self.embeddings.aembed_documents(batch)
+        return self._complete(keys, found, missing, vectors, dtype)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, serving previously seen texts from the cache and retrying transient failures"""
+        if not texts:
+            return []
+        return embedding_controller.call(self.embed_documents_array, texts).tolist()
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronously embed documents, serving previously seen texts from the cache and retrying transient failures"""
+        if not texts:
+            return []
+        return (await embedding_controller.acall(self.aembed_documents_array, texts)).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query; queries are cached in process by the wrapped embedder"""
+        return self.embeddings.embed_query(text)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronously embed a query with the wrapped embedder"""
+        return await self.embeddings.aembed_query(text)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached vectors"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._count}
@@ -0,0 +1,268 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import List, Dict, Any, Callable, Awaitable
+import numpy as np
+import httpx
+from cohere.core.api_error import ApiError
+from metrics import embedding_metrics
+
+logger = logging.getLogger(__name__)
+
+# Largest number of texts Cohere accepts in a single embed request
+COHERE_MAX_BATCH_SIZE = 96
+
+# Upper bound on embedding requests in flight at once; the controller
+# adapts between 1 and this, starting from EMBED_INITIAL_IN_FLIGHT
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", 16))
+EMBED_INITIAL_IN_FLIGHT = int(os.getenv("EMBED_INITIAL_IN_FLIGHT", 4))
+
+# Smallest batch the controller backs off to
+EMBED_MIN_BATCH_SIZE = int(os.getenv("EMBED_MIN_BATCH_SIZE", 8))
+
+# Requests slower than this (seconds) stop the controller from growing
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", 5.0))
+
+# Retry settings for rate limits, server errors and timeouts
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 6))
+EMBED_RETRY_BASE_DELAY = float(os.getenv("EMBED_RETRY_BASE_DELAY", 0.5))
+EMBED_RETRY_MAX_DELAY = float(os.getenv("EMBED_RETRY_MAX_DELAY", 30.0))
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an embedding error is transient: HTTP 429, 5xx, a timeout or a dropped connection"""
+    if isinstance(error, ApiError):
+        return error.status_code is not None and (error.status_code == 429 or error.status_code >= 500)
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+def _retry_after(error: Exception) -> float:
+    """Seconds the server asked us to wait, or 0"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or 0)
+    except ValueError:
+        return 0.0
+
+class EmbeddingController:
+    """
+    AIMD (additive increase, multiplicative decrease) control of embedding
+    batch size and concurrency.
+    
+    Every call that succeeds within target_latency counts towards growth:
+    once a full window of in_flight calls has succeeded, the batch size
+    grows by batch_step and one more request is allowed in flight. A
+    rate limit, server error or timeout halves both and the call is
+    retried after a jittered exponential backoff (or the server's
+    Retry-After). Slow but successful calls hold the settings steady.
+    
+    One controller is shared by all embedding calls in the process, since
+    rate limits apply to the API key rather than to a single upload. Each
+    request holds one of in_flight slots while it runs, so the limit holds
+    across every concurrent upload and session, not just within one call.
+    """
+    
+    def __init__(
+        self,
+        min_batch_size: int = EMBED_MIN_BATCH_SIZE,
+        max_batch_size: int = COHERE_MAX_BATCH_SIZE,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+        initial_in_flight: int = EMBED_INITIAL_IN_FLIGHT,
+        target_latency: float = EMBED_TARGET_LATENCY,
+        batch_step: int = 8,
+        max_retries: int = EMBED_MAX_RETRIES,
+        base_delay: float = EMBED_RETRY_BASE_DELAY,
+        max_delay: float = EMBED_RETRY_MAX_DELAY
+    ):
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.target_latency = target_latency
+        self.batch_step = batch_step
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self.batch_size = max_batch_size
+        self.in_flight = max(1, min(initial_in_flight, max_in_flight))
+        self._streak = 0
+        self._latency = None
+        self._counts = {"calls": 0, "failures": 0, "retries": 0, "increases": 0, "decreases": 0}
+        self._lock = threading.Lock()
+        # Requests currently holding a slot, and the condition they wait on
+        self._active = 0
+        self._slots = threading.Condition()
+    
+    def record_success(self, latency: float) -> None:
+        """Record a successful call and grow the limits after a good window"""
+        with self._lock:
+            self._counts["calls"] += 1
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if latency > self.target_latency:
+                self._streak = 0
+                return
+            self._streak += 1
+            if self._streak >= self.in_flight:
+                self._streak = 0
+                grown = (
+                    min(self.batch_size + self.batch_step, self.max_batch_size),
+                    min(self.in_flight + 1, self.max_in_flight)
+                )
+                if grown != (self.batch_size, self.in_flight):
+                    self.batch_size, self.in_flight = grown
+                    self._counts["increases"] += 1
+        with self._slots:
+            self._slots.notify_all()
+    
+    def record_failure(self) -> None:
+        """Record a transient failure and halve the limits"""
+        with self._lock:
+            self._counts["calls"] += 1
+            self._counts["failures"] += 1
+            self._streak = 0
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.in_flight = max(1, self.in_flight // 2)
+            self._counts["decreases"] += 1
+    
+    def _acquire(self, block: bool = True) -> bool:
+        """
+        Take a request slot.
+        
+        Args:
+            block: Wait until fewer than in_flight requests are running; with
+                False, return False instead of waiting
+        
+        Returns:
+            bool: Whether a slot was taken
+        """
+        with self._slots:
+            if block:
+                self._slots.wait_for(lambda: self._active < self.in_flight)
+            elif self._active >= self.in_flight:
+                return False
+            self._active += 1
+            return True
+    
+    async def _aacquire(self) -> None:
+        """Take a request slot without blocking the event loop"""
+        while not self._acquire(block=False):
+            await asyncio.sleep(0.05)
+    
+    def _force_acquire(self) -> None:
+        """Take a slot even if the limit is reached, so other callers still count this request"""
+        with self._slots:
+            self._active += 1
+    
+    def _release(self) -> None:
+        with self._slots:
+            self._active -= 1
+            self._slots.notify_all()
+    
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, at least as long as any Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, min(_retry_after(error), self.max_delay))
+    
+    def _on_error(self, attempt: int, error: Exception) -> float:
+        """Record a failed attempt and return the delay before retrying; re-raises if it is final"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            raise error
+        self.record_failure()
+        delay = self._backoff(attempt, error)
+        with self._lock:
+            self._counts["retries"] += 1
+        embedding_metrics.increment("retries")
+        logger.warning(
+            f"Embedding request failed ({type(error).__name__}), retrying in {delay:.1f}s "
+            f"with batch size {self.batch_size} and {self.in_flight} in flight"
+        )
+        return delay
+    
+    def call(self, embed: Callable[[List[str]], np.ndarray], texts: List[str], queue: bool = True) -> np.ndarray:
+        """
+        Embed texts, split to the current batch size, retrying transient failures.
+        
+        Args:
+            embed: Function that embeds one batch of texts
+            texts: Texts to embed
+            queue: Wait for a free slot before each request. Interactive
+                single-text requests (query embeddings) pass False to start
+                at once; they still occupy a slot while running.
+        
+        Returns:
+            np.ndarray: Embeddings of texts, in order
+        
+        Raises:
+            Exception: A non-retryable error, or the last error once retries run out
+        """
+        results = []
+        done = 0
+        attempt = 0
+        while done < len(texts):
+            # Re-read the batch size each time so retries go out smaller
+            batch = texts[done:done + self.batch_size]
+            self._acquire() if queue else self._force_acquire()
+            start = time.perf_counter()
+            try:
+                result = embed(batch)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                self._release()
+            if error is not None:
+                time.sleep(self._on_error(attempt, error))
+                attempt += 1
+                continue
+            self.record_success(time.perf_counter() - start)
+            results.append(result)
+            done += len(batch)
+            attempt = 0
+        return results[0] if len(results) == 1 else np.concatenate(results)
+    
+    async def acall(self, embed: Callable[[List[str]], Awaitable[np.ndarray]], texts: List[str], queue: bool = True) -> np.ndarray:
+        """Async counterpart of call"""
+        results = []
+        done = 0
+        attempt = 0
+        while done < len(texts):
+            # Re-read the batch size each time so retries go out smaller
+            batch = texts[done:done + self.batch_size]
+            if queue:
+                await self._aacquire()
+            else:
+                self._force_acquire()
+            start = time.perf_counter()
+            try:
+                result = await embed(batch)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                self._release()
+            if error is not None:
+                await asyncio.sleep(self._on_error(attempt, error))
+                attempt += 1
+                continue
+            self.record_success(time.perf_counter() - start)
+            results.append(result)
+            done += len(batch)
+            attempt = 0
+        return results[0] if len(results) == 1 else np.concatenate(results)
+    
+    def settings(self) -> Dict[str, Any]:
+        """Return the current batch size, concurrency, smoothed latency and counters"""
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "in_flight": self.in_flight,
+                "latency": None if self._latency is None else round(self._latency, 3),
+                "active": self._active,
+                **self._counts
+            }
+
+# Process-wide controller used by embed_batches and aembed_batches
+embedding_controller = EmbeddingController()
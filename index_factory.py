@@ -0,0 +1,215 @@
+import os
+import json
+import math
+import logging
+from typing import Dict, Any, Optional
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# Index type for float stores: "auto", "flat", "ivf" or "hnsw"
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+
+# Recall@k the approximate indexes are tuned for; higher costs latency
+INDEX_RECALL_TARGET = float(os.getenv("INDEX_RECALL_TARGET", 0.95))
+
+# "auto" keeps exact flat search up to this many chunks
+INDEX_FLAT_MAX_CHUNKS = int(os.getenv("INDEX_FLAT_MAX_CHUNKS", 50_000))
+
+# Above INDEX_FLAT_MAX_CHUNKS, "auto" picks HNSW for recall targets of at
+# least this (fast, high recall, more memory and slower to build) and IVF
+# below it (compact and quick to build)
+INDEX_HNSW_MIN_RECALL = float(os.getenv("INDEX_HNSW_MIN_RECALL", 0.97))
+
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+
+_INDEX_SPEC_FILE = "index_spec.json"
+
+# Memory-maps the codes of any index type; missing from older faiss
+# releases, which can only map IVF inverted lists
+_IO_FLAG_MMAP_CODES = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+# HNSW graph degree and build-time beam width
+_HNSW_M = 32
+_HNSW_EF_CONSTRUCTION = 80
+
+# IVF is trained on at most this many vectors per list
+_IVF_TRAINING_PER_LIST = 64
+
+# (recall target, fraction of IVF lists probed, HNSW efSearch), ascending
+_SEARCH_EFFORT = (
+    (0.90, 1 / 64, 32),
+    (0.95, 1 / 32, 64),
+    (0.98, 1 / 16, 128),
+    (1.00, 1 / 8, 256)
+)
+
+def choose_index(
+    count: int,
+    dimensions: int,
+    index_type: str = INDEX_TYPE,
+    recall_target: float = INDEX_RECALL_TARGET
+) -> Dict[str, Any]:
+    """
+    Choose an index type and its parameters for a corpus.
+    
+    Args:
+        count: Number of vectors to index
+        dimensions: Vector dimensions
+        index_type: "flat", "ivf", "hnsw", or "auto" to pick from count and recall_target
+        recall_target: Target recall of approximate search, used to set
+            nprobe (IVF) or efSearch (HNSW)
+    
+    Returns:
+        Dict[str, Any]: The index spec: type, count, dimensions,
+            recall_target, and nlist/nprobe (IVF) or M/ef_construction/
+            ef_search (HNSW)
+    
+    Raises:
+        ValueError: If index_type is not one of INDEX_TYPES
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    
+    if index_type == "auto":
+        if count <= INDEX_FLAT_MAX_CHUNKS:
+            index_type = "flat"
+        elif recall_target >= INDEX_HNSW_MIN_RECALL:
+            index_type = "hnsw"
+        else:
+            index_type = "ivf"
+    
+    spec: Dict[str, Any] = {
+        "type": index_type,
+        "count": count,
+        "dimensions": dimensions,
+        "recall_target": recall_target
+    }
+    _, probe_fraction, ef_search = next(
+        (effort for effort in _SEARCH_EFFORT if recall_target <= effort[0]), _SEARCH_EFFORT[-1]
+    )
+    
+    if index_type == "ivf":
+        # ~2 * sqrt(n) lists, with enough points per list to train well
+        nlist = max(1, min(int(2 * math.sqrt(count)), count // 39, 65536))
+        spec["nlist"] = nlist
+        spec["nprobe"] = min(nlist, max(8, int(nlist * probe_fraction)))
+    elif index_type == "hnsw":
+        spec["M"] = _HNSW_M
+        spec["ef_construction"] = _HNSW_EF_CONSTRUCTION
+        spec["ef_search"] = ef_search
+    return spec
+
+def build_index(vectors: np.ndarray, spec: Dict[str, Any], seed: int = 0) -> Any:
+    """
+    Build and fill the L2 index described by spec.
+    
+    IVF indexes are trained on a random sample of the vectors; the sample
+    size is recorded in spec["trained_on"]. They also get a direct map so
+    stored vectors can be reconstructed (e.g. for MMR retrieval).
+    
+    Args:
+        vectors: float32 array with one vector per row
+        spec: Index spec from choose_index
+        seed: Seed of the IVF training sample
+    
+    Returns:
+        Any: The FAISS index, with its search parameters applied
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dimensions = vectors.shape[1]
+    
+    if spec["type"] == "ivf":
+        quantizer = faiss.IndexFlatL2(dimensions)
+        index = faiss.IndexIVFFlat(quantizer, dimensions, spec["nlist"], faiss.METRIC_L2)
+        sample_size = min(len(vectors), spec["nlist"] * _IVF_TRAINING_PER_LIST)
+        sample = vectors
+        if sample_size < len(vectors):
+            sample = vectors[np.sort(np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False))]
+        index.train(sample)
+        spec["trained_on"] = sample_size
+    elif spec["type"] == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensions, spec["M"], faiss.METRIC_L2)
+        index.hnsw.efConstruction = spec["ef_construction"]
+    else:
+        index = faiss.IndexFlatL2(dimensions)
+    
+    index.add(vectors)
+    if spec["type"] == "ivf":
+        index.make_direct_map()
+    set_search_params(index, spec.get("nprobe"), spec.get("ef_search"))
+    logger.info(f"Built {spec['type']} index over {len(vectors)} vectors: {spec}")
+    return index
+
+def set_search_params(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    Set query-time search effort on an index; parameters that do not apply are ignored.
+    
+    Args:
+        index: FAISS index
+        nprobe: Number of IVF lists scanned per query
+        ef_search: HNSW search beam width
+    """
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # Not an IVF index
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+def mmap_flags(index_type: Optional[str] = None) -> int:
+    """
+    FAISS IO flags that memory-map an index instead of reading it into RAM.
+    
+    IVF indexes map their inverted lists; flat, HNSW, scalar-quantizer and
+    binary indexes map their code arrays. Mapped indexes are read-only:
+    adding vectors to one aborts the process. With a faiss release that
+    cannot map codes, non-IVF indexes are read into RAM instead.
+    
+    Args:
+        index_type: Type recorded in the index spec, if known
+    
+    Returns:
+        int: Flags for faiss.read_index / faiss.read_index_binary
+    """
+    if index_type == "ivf":
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    if _IO_FLAG_MMAP_CODES is None:
+        logger.info(f"This faiss version cannot memory-map {index_type or 'flat'} indexes; reading into memory")
+        return 0
+    return _IO_FLAG_MMAP_CODES | faiss.IO_FLAG_READ_ONLY
+
+def tune_search(vectorstore: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    Change the search effort of a vector store's index at query time.
+    
+    Higher nprobe / ef_search raise recall and latency. The new values are
+    recorded in the store's index_spec, so they are saved with it.
+    
+    Args:
+        vectorstore: FAISS vector store
+        nprobe: Number of IVF lists scanned per query
+        ef_search: HNSW search beam width
+    """
+    set_search_params(vectorstore.index, nprobe, ef_search)
+    spec = getattr(vectorstore, "index_spec", None)
+    if spec is not None:
+        if nprobe is not None and "nprobe" in spec:
+            spec["nprobe"] = nprobe
+        if ef_search is not None and "ef_search" in spec:
+            spec["ef_search"] = ef_search
+
+def save_index_spec(folder_path: str, spec: Dict[str, Any]) -> None:
+    """Record an index spec next to a saved index"""
+    with open(os.path.join(folder_path, _INDEX_SPEC_FILE), "w") as f:
+        json.dump(spec, f)
+
+def load_index_spec(folder_path: str) -> Optional[Dict[str, Any]]:
+    """Return the index spec saved in folder_path, or None for stores saved without one"""
+    try:
+        with open(os.path.join(folder_path, _INDEX_SPEC_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
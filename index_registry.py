@@ -0,0 +1,133 @@
+import weakref
+import threading
+import logging
+from typing import Dict, Any, Callable, Optional
+from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    """A registered vector store, or one still being built"""
+    
+    def __init__(self):
+        self.ready = threading.Event()
+        self.vectorstore: Optional[FAISS] = None
+        self.error: Optional[Exception] = None
+        self.references = 0
+
+class IndexLease:
+    """
+    A session's reference to a shared vector store.
+    
+    The reference is dropped by release() or, failing that, when the lease
+    is garbage collected (e.g. with the session state that holds it).
+    """
+    
+    def __init__(self, registry: "IndexRegistry", key: str, vectorstore: FAISS):
+        self.key = key
+        self.vectorstore = vectorstore
+        self._finalizer = weakref.finalize(self, registry._release, key)
+    
+    def release(self) -> None:
+        """Drop the reference; calling it again has no effect"""
+        self._finalizer()
+    
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+class IndexRegistry:
+    """
+    Process-wide registry of read-only vector stores shared between sessions.
+    
+    Stores are keyed by library fingerprint (see index_store.library_key)
+    and reference counted: the first session to acquire a key builds or
+    loads the store while concurrent sessions wait for it instead of
+    building their own, later sessions attach to the same object, and the
+    store is dropped once the last lease is released. Memory therefore
+    scales with the number of distinct libraries in use, not with the
+    number of sessions. Shared stores must not be modified.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self.builds = 0
+        self.attaches = 0
+    
+    def acquire(self, key: str, build: Callable[[], FAISS]) -> IndexLease:
+        """
+        Attach to the store registered under key, building it if needed.
+        
+        Args:
+            key: Library fingerprint
+            build: Called once to create the store when no session holds it
+        
+        Returns:
+            IndexLease: Lease holding the shared store
+        
+        Raises:
+            Exception: Whatever build raised, in the building session and in
+                every session that was waiting for it. If the build is
+                interrupted by anything else (e.g. Streamlit stopping or
+                rerunning the building session), only that session sees it
+                and a waiting session builds the store instead.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                builder = entry is None
+                if builder:
+                    entry = self._entries[key] = _Entry()
+                    self.builds += 1
+                else:
+                    self.attaches += 1
+                entry.references += 1
+            
+            if builder:
+                try:
+                    entry.vectorstore = build()
+                except BaseException as e:
+                    # Only real build failures are handed to waiting sessions
+                    if isinstance(e, Exception):
+                        entry.error = e
+                    with self._lock:
+                        # Let the next session try again
+                        if self._entries.get(key) is entry:
+                            del self._entries[key]
+                    raise
+                finally:
+                    entry.ready.set()
+                logger.info(f"Registered shared index {key[:12]}")
+                return IndexLease(self, key, entry.vectorstore)
+            
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            if entry.vectorstore is not None:
+                logger.info(f"Attached to shared index {key[:12]} ({entry.references} references)")
+                return IndexLease(self, key, entry.vectorstore)
+            # The building session was interrupted; build it here or wait for another session
+    
+    def _release(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.references -= 1
+            if entry.references <= 0:
+                del self._entries[key]
+                logger.info(f"Dropped shared index {key[:12]}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the registered stores with their reference counts, and build/attach totals"""
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "references": {key[:12]: entry.references for key, entry in self._entries.items()},
+                "builds": self.builds,
+                "attaches": self.attaches
+            }
+
+# Shared by every session in the process
+index_registry = IndexRegistry()
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import logging
+from typing import List, Dict, Any, BinaryIO, Optional, Sequence, Tuple
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from ingest_cache import hash_file
+from vectorstore import load_vectorstore, save_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Persistent store of ingested document libraries
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", ".index_store")
+
+# Memory-map saved indexes when reopening them
+INDEX_STORE_MMAP = os.getenv("INDEX_STORE_MMAP", "1") != "0"
+
+# Number of libraries remembered per user
+INDEX_STORE_RECENT = int(os.getenv("INDEX_STORE_RECENT", 10))
+
+# Bump when the on-disk layout changes; entries of other versions are ignored
+FORMAT_VERSION = 1
+
+_MANIFEST_FILE = "manifest.json"
+_USERS_DIR = "users"
+
+def library_key(files: Sequence[Tuple[BinaryIO, str]], *params: Any) -> str:
+    """
+    Fingerprint a set of documents and the settings they are ingested with.
+    
+    The key does not depend on the order of the files.
+    
+    Args:
+        files: (file, filetype) pairs
+        *params: Settings that change the resulting index (embedding model,
+            chunk size, embedding type, ...)
+    
+    Returns:
+        str: Hex digest identifying the library
+    """
+    documents = sorted(f"{hash_file(file)}:{filetype}" for file, filetype in files)
+    parts = [str(FORMAT_VERSION), *documents, *(str(param) for param in params)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+class IndexStore:
+    """
+    Versioned on-disk store of the vector stores built for document libraries.
+    
+    Each entry is a directory named after its library key, holding the
+    saved index, docstore and index spec plus a manifest.json that records
+    the format version, file names, store class and size. Entries are
+    reopened with the index memory-mapped, so opening a large library takes
+    milliseconds and index pages are read from disk on first use. Each
+    user's most recent libraries are remembered so they can be reopened
+    after a refresh, logout or restart without re-uploading.
+    """
+    
+    def __init__(self, root: str = INDEX_STORE_DIR, mmap: bool = INDEX_STORE_MMAP):
+        self.root = root
+        self.mmap = mmap
+        os.makedirs(os.path.join(self.root, _USERS_DIR), exist_ok=True)
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def _user_path(self, user: str) -> str:
+        return os.path.join(self.root, _USERS_DIR, hashlib.sha256(user.encode("utf-8")).hexdigest() + ".json")
+    
+    def manifest(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the manifest of the entry saved under key, or None if there is no readable entry"""
+        try:
+            with open(os.path.join(self._entry_path(key), _MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format_version") != FORMAT_VERSION:
+            logger.info(f"Ignoring index store entry {key[:12]} with format version {manifest.get('format_version')}")
+            return None
+        return manifest
+    
+    def save(self, key: str, vectorstore: FAISS, names: List[str], user: Optional[str] = None) -> None:
+        """
+        Save a library's vector store under key.
+        
+        Args:
+            key: Library key from library_key
+            vectorstore: Vector store built for the library
+            names: File names of the library's documents
+            user: Optional user to remember the library for
+        """
+        if self.manifest(key) is None:
+            spec = getattr(vectorstore, "index_spec", None) or {}
+            manifest = {
+                "format_version": FORMAT_VERSION,
+                "key": key,
+                "names": names,
+                "store": type(vectorstore).__name__,
+                "index_type": spec.get("type", "flat"),
+                "chunks": vectorstore.index.ntotal,
+                "model": getattr(vectorstore.embedding_function, "model", None),
+                "created": time.time()
+            }
+            staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+            try:
+                save_vectorstore(vectorstore, staging)
+                # The manifest is written last: an entry without one is incomplete
+                with open(os.path.join(staging, _MANIFEST_FILE), "w") as f:
+                    json.dump(manifest, f)
+                shutil.rmtree(self._entry_path(key), ignore_errors=True)
+                os.replace(staging, self._entry_path(key))
+                logger.info(f"Saved index store entry {key[:12]} ({manifest['chunks']} chunks)")
+            except Exception as e:
+                logger.error(f"Error writing index store entry {key[:12]}: {str(e)}")
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+        
+        if user is not None:
+            self.remember(user, key)
+    
+    def load(self, key: str, embeddings: Embeddings) -> Optional[FAISS]:
+        """
+        Reopen the vector store saved under key.
+        
+        With mmap enabled the returned store is read-only.
+        
+        Args:
+            key: Library key from library_key
+            embeddings: Embeddings attached to the loaded store for queries
+        
+        Returns:
+            Optional[FAISS]: The saved vector store, or None if there is no usable entry
+        """
+        if self.manifest(key) is None:
+            return None
+        
+        start = time.perf_counter()
+        try:
+            # Entries are only ever written by this store, so unpickling is safe
+            vectorstore = load_vectorstore(self._entry_path(key), embeddings, mmap=self.mmap)
+        except Exception as e:
+            logger.error(f"Error loading index store entry {key[:12]}: {str(e)}")
+            return None
+        logger.info(f"Opened index store entry {key[:12]} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return vectorstore
+    
+    def remember(self, user: str, key: str) -> None:
+        """Move key to the front of the user's recent libraries"""
+        keys = [key] + [other for other in self._recent_keys(user) if other != key]
+        path = self._user_path(user)
+        fd, staging = tempfile.mkstemp(prefix=".staging-", dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            json.dump(keys[:INDEX_STORE_RECENT], f)
+        os.replace(staging, path)
+    
+    def _recent_keys(self, user: str) -> List[str]:
+        try:
+            with open(self._user_path(user)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+    
+    def recent(self, user: str) -> List[Dict[str, Any]]:
+        """Return the manifests of the user's saved libraries, most recent first"""
+        manifests = (self.manifest(key) for key in self._recent_keys(user))
+        return [manifest for manifest in manifests if manifest is not None]
@@ -0,0 +1,407 @@
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, Dict, Iterator, BinaryIO, Optional, TextIO, Sequence, Tuple
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from utils import iter_segments, iter_chunks, extraction_pool, Segment, Chunk, SEGMENT_SEPARATORS
+from vectorstore import (
+    get_default_embeddings,
+    COHERE_MAX_BATCH_SIZE,
+    EMBED_MAX_IN_FLIGHT,
+    chunk_metadatas,
+    create_vectorstore,
+    reindex_vectorstore,
+    reduce_vectorstore,
+    merge_vectorstores,
+    embed_batches
+)
+from quantization import EMBEDDING_TYPE
+from reduction import REDUCTION
+from index_factory import INDEX_TYPE
+from ingest_cache import IngestCache
+from dedup import ChunkDeduplicator
+from columnar_docstore import ColumnarDocstore
+from metrics import embedding_metrics
+
+# Streaming ingestion settings
+INGEST_BATCH_SIZE = COHERE_MAX_BATCH_SIZE
+INGEST_MAX_PENDING_BATCHES = 4
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1") != "0"
+# Also collapse near-duplicate chunks (see ChunkDeduplicator); off by default
+INGEST_NEAR_DEDUP = os.getenv("INGEST_NEAR_DEDUP", "0") != "0"
+
+# Number of files ingested concurrently by ingest_documents
+INGEST_FILE_WORKERS = int(os.getenv("INGEST_FILE_WORKERS", min(8, (os.cpu_count() or 1) + 4)))
+
+# Marks the end of the producer's output on the batch queue
+_DONE = object()
+
+def iter_document_chunks(
+    file: BinaryIO,
+    filetype: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    text_sink: Optional[TextIO] = None,
+    executor: Optional[Executor] = None
+) -> Iterator[Chunk]:
+    """
+    Lazily extract and chunk a document.
+    
+    Args:
+        file: File-like object containing the document
+        filetype: Type of the file (pdf, docx, pptx, xlsx, xls, txt, md)
+        chunk_size: Maximum size of each chunk (in characters)
+        chunk_overlap: Number of characters to overlap between chunks
+        text_sink: Optional stream that receives the extracted text as it is read
+        executor: Optional process pool for PDF and spreadsheet extraction
+    
+    Returns:
+        Iterator[Chunk]: Chunk text, the page or slide and the sheet it
+            starts in and its character offset in the extracted text, in
+            document order
+    """
+    segments = iter_segments(file, filetype, executor=executor)
+    separator = SEGMENT_SEPARATORS.get(filetype, "\n")
+    if text_sink is not None:
+        segments = _tee_segments(segments, separator, text_sink)
+    return iter_chunks(segments, separator, chunk_size, chunk_overlap)
+
+def _tee_segments(segments: Iterator[Segment], separator: str, sink: TextIO) -> Iterator[Segment]:
+    """Write the text of each segment to sink, joined by separator, while passing it through"""
+    for i, segment in enumerate(segments):
+        if i:
+            sink.write(separator)
+        sink.write(segment.text)
+        yield segment
+
+def _dedup_chunks(
+    chunks: Iterator[Chunk],
+    deduplicator: ChunkDeduplicator,
+    duplicates: List[List[Dict[str, int]]]
+) -> Iterator[Chunk]:
+    """
+    Drop duplicate chunks from the stream before they are embedded.
+    
+    duplicates[i] collects where every chunk collapsed into unique chunk i
+    came from: its "char_start" and "char_end" in the extracted text, and
+    its "page" and "sheet" when known.
+    """
+    for chunk in chunks:
+        index, is_new = deduplicator.add(chunk.text)
+        if is_new:
+            duplicates.append([])
+            yield chunk
+        else:
+            source = {"char_start": chunk.start, "char_end": chunk.start + len(chunk.text)}
+            if chunk.page is not None:
+                source["page"] = chunk.page
+            if chunk.sheet is not None:
+                source["sheet"] = chunk.sheet
+            duplicates[index].append(source)
+
+def _produce_batches(
+    chunks: Iterator[Chunk],
+    batch_size: int,
+    batches: queue.Queue,
+    stop: threading.Event
+) -> None:
+    """
+    Group chunks into batches and put them on the queue.
+    
+    Runs on a background thread. Blocks while the queue is full, so the
+    producer never gets more than the queue size ahead of the embedder.
+    Any exception is forwarded to the consumer through the queue.
+    """
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    try:
+        batch: List[Chunk] = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+        put(_DONE)
+    except Exception as e:
+        put(e)
+
+def ingest_document(
+    file: BinaryIO,
+    filetype: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    embeddings: Optional[Embeddings] = None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_pending_batches: int = INGEST_MAX_PENDING_BATCHES,
+    max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    text_sink: Optional[TextIO] = None,
+    cache: Optional[IngestCache] = None,
+    source_name: Optional[str] = None,
+    dedup: bool = INGEST_DEDUP,
+    near_dedup: bool = INGEST_NEAR_DEDUP,
+    stats: Optional[Dict[str, int]] = None,
+    embedding_type: str = EMBEDDING_TYPE,
+    reduction: str = REDUCTION,
+    index_type: str = INDEX_TYPE,
+    executor: Optional[Executor] = None
+) -> FAISS:
+    """
+    Extract, chunk and embed a document as a single streaming pipeline.
+    
+    Extraction and chunking run on a background thread and hand batches of
+    chunks to the caller's thread through a bounded queue, so embedding
+    requests start as soon as the first pages are decoded and at most
+    max_pending_batches batches of text are buffered at any time. Up to
+    max_in_flight batches are embedded concurrently and the FAISS index is
+    built once, after the last batch returns.
+    
+    With dedup enabled, exact duplicate chunks (repeated footers, header
+    rows, boilerplate) are collapsed before embedding, and with near_dedup
+    also near duplicates. The kept chunk lists where each chunk it stands
+    for came from in its "duplicates" metadata. Deduplication is per
+    document, so each document's store (and cache entry) is complete on
+    its own.
+    
+    Args:
+        file: File-like object containing the document
+        filetype: Type of the file (pdf, docx, pptx, xlsx, xls, txt, md)
+        chunk_size: Maximum size of each chunk (in characters)
+        chunk_overlap: Number of characters to overlap between chunks
+        embeddings: Embeddings used for the chunks (defaults to get_default_embeddings())
+        batch_size: Number of chunks per embedding request
+        max_pending_batches: Maximum number of batches buffered ahead of the embedder
+        max_in_flight: Maximum number of concurrent embedding requests
+        text_sink: Optional stream that receives the extracted text as it is read
+        cache: Optional ingestion cache; a hit skips extraction and embedding entirely
+        source_name: Optional file name recorded in each chunk's "file" metadata
+        dedup: Whether to collapse duplicate chunks before embedding
+        near_dedup: Whether dedup also collapses near-duplicate chunks
+        stats: Optional dict filled with chunk, duplicate and savings counts
+        embedding_type: "float", or "int8" / "binary" for a compressed index
+        reduction: "none", or "pca" / "random" to search in fewer dimensions
+        index_type: "auto" to pick flat, IVF or HNSW from the number of
+            chunks, or one of them explicitly; cached stores are flat and
+            reindexed on the way out
+        executor: Optional process pool for PDF and spreadsheet extraction,
+            shared with other documents (one is created per document otherwise)
+    
+    Returns:
+        FAISS: A FAISS vector store containing the embedded chunks
+    
+    Raises:
+        ValueError: If the document contains no text
+        Exception: For any error raised during extraction or embedding
+    """
+    embeddings = embeddings or get_default_embeddings()
+    
+    if cache is not None:
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        if embedding_type != "float":
+            model = f"{model}:{embedding_type}"
+        if reduction != "none":
+            model = f"{model}:{reduction}"
+        # Deduplication changes which chunks are stored and their metadata
+        dedup_mode = ("near" if near_dedup else "exact") if dedup else "off"
+        key = cache.key_for(file, filetype, chunk_size, chunk_overlap, model, dedup_mode)
+        vectorstore = cache.get(key, embeddings)
+        if vectorstore is not None:
+            # The same bytes may have been cached under another file name
+            _label_file(vectorstore, source_name)
+            if stats is not None:
+                stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            return reindex_vectorstore(vectorstore, index_type)
+        
+        # Spool the extracted text to disk so the cache can keep a copy of it
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+            vectorstore = ingest_document(
+                file, filetype, chunk_size, chunk_overlap, embeddings,
+                batch_size, max_pending_batches, max_in_flight, text_sink=spool, source_name=source_name,
+                dedup=dedup, near_dedup=near_dedup, stats=stats, embedding_type=embedding_type,
+                reduction=reduction, index_type="flat", executor=executor
+            )
+            spool.seek(0)
+            cache.put(key, vectorstore, spool)
+        return reindex_vectorstore(vectorstore, index_type)
+    
+    # "extract" is the time spent extracting and chunking on the producer thread
+    chunks = embedding_metrics.timed_iter(
+        iter_document_chunks(file, filetype, chunk_size, chunk_overlap, text_sink, executor), "extract"
+    )
+    deduplicator = ChunkDeduplicator(near_dedup) if dedup else None
+    duplicates: List[List[Dict[str, int]]] = []
+    if deduplicator is not None:
+        chunks = _dedup_chunks(chunks, deduplicator, duplicates)
+    batches: queue.Queue = queue.Queue(maxsize=max_pending_batches)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce_batches,
+        args=(chunks, batch_size, batches, stop),
+        name="ingest-producer",
+        daemon=True
+    )
+    producer.start()
+    
+    texts: List[str] = []
+    pages: List[Optional[int]] = []
+    sheets: List[Optional[int]] = []
+    starts: List[int] = []
+    
+    def queued_batches() -> Iterator[List[str]]:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            texts.extend(chunk.text for chunk in batch)
+            pages.extend(chunk.page for chunk in batch)
+            sheets.extend(chunk.sheet for chunk in batch)
+            starts.extend(chunk.start for chunk in batch)
+            yield [chunk.text for chunk in batch]
+    
+    try:
+        with embedding_metrics.stage("embed"):
+            vectors = embed_batches(embeddings, queued_batches(), max_in_flight, embedding_type)
+    finally:
+        stop.set()
+        producer.join()
+    
+    if not texts:
+        raise ValueError("No documents were processed - vector store is empty")
+    
+    metadatas = chunk_metadatas(len(texts), source_name, pages, starts, texts, sheets)
+    
+    if deduplicator is not None:
+        # Unique chunks are embedded in order, so metadatas[i] is unique chunk i
+        for metadata, sources in zip(metadatas, duplicates):
+            if sources:
+                metadata["duplicates"] = sources
+        
+        dedup_stats = deduplicator.stats
+        saved = dedup_stats["chunks"] - dedup_stats["unique"]
+        calls_saved = -(-dedup_stats["chunks"] // batch_size) - -(-dedup_stats["unique"] // batch_size)
+        print(f"Skipped {saved} duplicate chunks, saving {calls_saved} embedding calls")
+        if stats is not None:
+            for name, value in dedup_stats.items():
+                stats[name] = stats.get(name, 0) + value
+            stats["index_entries_saved"] = stats.get("index_entries_saved", 0) + saved
+            stats["embedding_calls_saved"] = stats.get("embedding_calls_saved", 0) + calls_saved
+    
+    with embedding_metrics.stage("index_build"):
+        vectorstore = create_vectorstore(
+            texts, vectors, metadatas, embeddings, embedding_type, reduction=reduction, index_type=index_type
+        )
+    print(f"Successfully ingested {len(texts)} chunks")
+    return vectorstore
+
+def _label_file(vectorstore: FAISS, source_name: Optional[str]) -> None:
+    """Set the "file" metadata of every chunk in the store to source_name"""
+    if isinstance(vectorstore.docstore, ColumnarDocstore):
+        vectorstore.docstore.set_file(source_name)
+        return
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        metadata = vectorstore.docstore.search(doc_id).metadata
+        if source_name is None:
+            metadata.pop("file", None)
+        else:
+            metadata["file"] = source_name
+
+def ingest_documents(
+    files: Sequence[Tuple[BinaryIO, str]],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    embeddings: Optional[Embeddings] = None,
+    cache: Optional[IngestCache] = None,
+    max_workers: int = INGEST_FILE_WORKERS,
+    stats: Optional[Dict[str, int]] = None,
+    embedding_type: str = EMBEDDING_TYPE,
+    reduction: str = REDUCTION,
+    index_type: str = INDEX_TYPE
+) -> FAISS:
+    """
+    Ingest several documents concurrently into a single FAISS vector store.
+    
+    Each file runs through its own ingest_document pipeline on a thread
+    pool, so extraction of one file overlaps with embedding requests for
+    the others. PDF and spreadsheet extraction of all files share one
+    process pool of EXTRACT_PROCESS_WORKERS workers. The per-file stores are built with flat indexes, merged in
+    input order and then reindexed once for the size of the whole library.
+    With several files, reduction is also applied once to the merged
+    library, so a PCA is fitted to every file instead of the first one.
+    Every chunk records the name of its file in its "file" metadata.
+    
+    Args:
+        files: (file, filetype) pairs; each file's name attribute is used as
+            its provenance label when present
+        chunk_size: Maximum size of each chunk (in characters)
+        chunk_overlap: Number of characters to overlap between chunks
+        embeddings: Embeddings used for the chunks (defaults to get_default_embeddings())
+        cache: Optional ingestion cache shared by all files
+        max_workers: Maximum number of files ingested at the same time
+        stats: Optional dict filled with counts summed over all files
+        embedding_type: "float", or "int8" / "binary" for a compressed index
+        reduction: "none", or "pca" / "random" to search in fewer dimensions
+        index_type: "auto" to pick flat, IVF or HNSW from the total number
+            of chunks, or one of them explicitly
+    
+    Returns:
+        FAISS: A FAISS vector store containing the chunks of every file
+    
+    Raises:
+        ValueError: If no files are given, a file cannot be processed or
+            reduction is combined with compressed embeddings
+    """
+    if not files:
+        raise ValueError("No documents were provided")
+    if reduction != "none" and embedding_type != "float":
+        raise ValueError("Dimensionality reduction requires float embeddings")
+    
+    embeddings = embeddings or get_default_embeddings()
+    # Per-file projections would not match, so reduce after merging
+    file_reduction = reduction if len(files) == 1 else "none"
+    
+    def ingest_one(item: Tuple[BinaryIO, str]) -> Tuple[FAISS, Dict[str, int]]:
+        file, filetype = item
+        name = getattr(file, "name", None)
+        file_stats: Dict[str, int] = {}
+        try:
+            vectorstore = ingest_document(
+                file, filetype, chunk_size, chunk_overlap, embeddings,
+                cache=cache, source_name=name, stats=file_stats, embedding_type=embedding_type,
+                reduction=file_reduction, index_type="flat", executor=pool
+            )
+            return vectorstore, file_stats
+        except Exception as e:
+            raise ValueError(f"Error processing {name or filetype}: {str(e)}") from e
+    
+    workers = max(1, min(max_workers, len(files)))
+    print(f"Ingesting {len(files)} documents with {workers} workers")
+    with extraction_pool() as pool, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as executor:
+        results = list(executor.map(ingest_one, files))
+    
+    vectorstore = results[0][0]
+    merge_vectorstores(vectorstore, *[other for other, _ in results[1:]])
+    
+    if stats is not None:
+        for _, file_stats in results:
+            for name, value in file_stats.items():
+                stats[name] = stats.get(name, 0) + value
+    
+    print(f"Merged {len(files)} documents into {vectorstore.index.ntotal} chunks")
+    with embedding_metrics.stage("index_build"):
+        if file_reduction != reduction:
+            return reduce_vectorstore(vectorstore, reduction, index_type)
+        return reindex_vectorstore(vectorstore, index_type)
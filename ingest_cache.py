@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import logging
+from typing import List, BinaryIO, Optional, TextIO
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from vectorstore import load_vectorstore, save_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Disk cache settings
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", ".ingest_cache")
+INGEST_CACHE_MAX_BYTES = int(os.getenv("INGEST_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Bump when the on-disk entry layout changes so stale entries are ignored
+CACHE_VERSION = 2
+
+def hash_file(file: BinaryIO, block_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 of a file-like object without loading it whole.
+    
+    Args:
+        file: File-like object to hash; it is rewound before and after
+        block_size: Number of bytes read per block
+    
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(block_size), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+class IngestCache:
+    """
+    Content-addressed disk cache of ingested documents.
+    
+    Each entry is a directory named after the cache key and holds the
+    extracted text, the chunk list and the saved FAISS index. Entries are
+    evicted least-recently-used first once the cache exceeds max_bytes;
+    a directory's mtime records its last use.
+    """
+    
+    def __init__(self, root: str = INGEST_CACHE_DIR, max_bytes: int = INGEST_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+    
+    def key_for(
+        self,
+        file: BinaryIO,
+        filetype: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        model: str,
+        dedup: str = "off"
+    ) -> str:
+        """Build the cache key for a document and the parameters it is ingested with"""
+        parts = [str(CACHE_VERSION), hash_file(file), filetype, str(chunk_size), str(chunk_overlap), model, dedup]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def get(self, key: str, embeddings: Embeddings) -> Optional[FAISS]:
+        """
+        Load the vector store cached under key.
+        
+        Args:
+            key: Cache key from key_for
+            embeddings: Embeddings attached to the loaded store for queries
+        
+        Returns:
+            Optional[FAISS]: The cached vector store, or None on a miss
+        """
+        path = self._entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        
+        try:
+            # Entries are only ever written by this cache, so unpickling is safe
+            vectorstore = load_vectorstore(path, embeddings)
+            os.utime(path)  # Mark as recently used
+            logger.info(f"Ingest cache hit: {key[:12]}")
+            return vectorstore
+        except Exception as e:
+            logger.error(f"Error loading ingest cache entry {key[:12]}: {str(e)}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+    
+    def get_text(self, key: str) -> Optional[str]:
+        """Return the extracted text cached under key, or None on a miss"""
+        try:
+            with open(os.path.join(self._entry_path(key), "text.txt"), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def get_chunks(self, key: str) -> Optional[List[str]]:
+        """Return the chunks cached under key, or None on a miss"""
+        try:
+            with open(os.path.join(self._entry_path(key), "chunks.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, key: str, vectorstore: FAISS, text: TextIO) -> None:
+        """
+        Store an ingested document under key, then evict old entries.
+        
+        Args:
+            key: Cache key from key_for
+            vectorstore: Vector store built for the document
+            text: Readable text stream holding the extracted text
+        """
+        path = self._entry_path(key)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            save_vectorstore(vectorstore, staging)
+            
+            with open(os.path.join(staging, "text.txt"), "w", encoding="utf-8") as f:
+                shutil.copyfileobj(text, f)
+            
+            chunks = [
+                vectorstore.docstore.search(doc_id).page_content
+                for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+            ]
+            with open(os.path.join(staging, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            
+            # Publish the entry atomically; another session may have won the race
+            try:
+                os.replace(staging, path)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception as e:
+            logger.error(f"Error writing ingest cache entry {key[:12]}: {str(e)}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        
+        self.evict()
+    
+    def evict(self) -> None:
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+                total += size
+            except OSError:
+                continue  # Removed concurrently
+        
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted ingest cache entry {os.path.basename(path)[:12]}")
@@ -0,0 +1,79 @@
+import os
+import re
+import hashlib
+from functools import lru_cache
+from collections import Counter
+from typing import List, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Output dimensions of the local hashing embedder
+LOCAL_EMBED_DIMENSIONS = int(os.getenv("LOCAL_EMBED_DIMENSIONS", 512))
+
+_TOKEN = re.compile(r"\w+")
+
+@lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    """Stable 64-bit hash of a feature (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+class HashingEmbeddings(Embeddings):
+    """
+    Fully local embeddings from hashed word n-gram counts.
+    
+    Each text's word unigrams and bigrams are hashed into a fixed number
+    of dimensions with a random sign (the "hashing trick", which acts as a
+    sparse random projection of the TF vector), weighted by 1 + log(tf)
+    and L2-normalized, so cosine/L2 search ranks by lexical overlap.
+    There is no model and no state: results are deterministic across
+    processes, need no network and cost microseconds per chunk. Quality
+    is lexical rather than semantic, which suits bulk or low-value
+    documents, offline benchmarks and tests.
+    """
+    
+    # Embedders that run in process are not worth caching on disk
+    local = True
+    
+    def __init__(self, dimensions: int = LOCAL_EMBED_DIMENSIONS, ngram_range: Tuple[int, int] = (1, 2)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.model = f"hashing-{dimensions}-{ngram_range[0]}{ngram_range[1]}"
+    
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN.findall(text.lower())
+        low, high = self.ngram_range
+        features = []
+        for n in range(low, high + 1):
+            features.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+        return features
+    
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a float32 array of shape (len(texts), dimensions)"""
+        rows: List[int] = []
+        hashes: List[int] = []
+        counts: List[int] = []
+        for row, text in enumerate(texts):
+            tf = Counter(self._features(text))
+            rows.extend([row] * len(tf))
+            hashes.extend(map(_feature_hash, tf))
+            counts.extend(tf.values())
+        
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        if hashes:
+            hashed = np.array(hashes, dtype=np.uint64)
+            columns = (hashed % np.uint64(self.dimensions)).astype(np.int64)
+            signs = np.where(hashed >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+            weights = signs * (1 + np.log(np.array(counts, dtype=np.float32)))
+            np.add.at(vectors, (np.array(rows), columns), weights)
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents"""
+        return self.embed_documents_array(texts).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self.embed_documents_array([text])[0].tolist()
@@ -0,0 +1,247 @@
+import json
+import time
+import bisect
+import inspect
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Sequence, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 96, 128, 256, 512, 1024)
+CHAR_BUCKETS = (100, 1000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000)
+STAGE_BUCKETS_S = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, as used by Prometheus.
+    
+    Not thread-safe on its own; EmbeddingMetrics guards it with its lock.
+    """
+    
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+    
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = self.bounds[i - 1] if i else min(self.min, self.bounds[0])
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ("+Inf",), self.counts)}
+        }
+
+class EmbeddingMetrics:
+    """
+    Process-wide counters and histograms for the embedding pipeline.
+    
+    Records per-call latency, texts and characters per call, errors,
+    retries, in-flight requests and cache hits, plus the wall time of each
+    ingestion stage (extraction, embedding, index build), so a slow ingest
+    can be attributed to the right stage. Export with snapshot() (JSON)
+    or to_prometheus() (text exposition format).
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        """Clear every counter and histogram"""
+        with self._lock:
+            self.counters: Dict[str, int] = {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "texts": 0,
+                "chars": 0,
+                "cache_hits": 0,
+                "cache_misses": 0,
+                "query_cache_hits": 0,
+                "query_cache_misses": 0
+            }
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+            self.texts_per_call = Histogram(SIZE_BUCKETS)
+            self.chars_per_call = Histogram(CHAR_BUCKETS)
+            self.stages: Dict[str, Histogram] = {}
+    
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add value to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    @contextmanager
+    def track_call(self, texts: List[str]) -> Iterator[None]:
+        """
+        Time one embedding API call and count what it sends.
+        
+        Args:
+            texts: Texts sent in the call
+        """
+        chars = sum(len(text) for text in texts)
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.in_flight -= 1
+                self.counters["calls"] += 1
+                self.counters["texts"] += len(texts)
+                self.counters["chars"] += chars
+                self.latency_ms.observe(elapsed_ms)
+                self.texts_per_call.observe(len(texts))
+                self.chars_per_call.observe(chars)
+    
+    def tracked(self, method: Callable) -> Callable:
+        """
+        Decorate an embedding method called as method(self, texts, ...) so every call runs under track_call.
+        
+        Works for plain and async methods.
+        """
+        if inspect.iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(owner, texts: List[str], *args, **kwargs):
+                with self.track_call(texts):
+                    return await method(owner, texts, *args, **kwargs)
+            return async_wrapper
+        
+        @wraps(method)
+        def wrapper(owner, texts: List[str], *args, **kwargs):
+            with self.track_call(texts):
+                return method(owner, texts, *args, **kwargs)
+        return wrapper
+    
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Record the wall time of one run of an ingestion stage"""
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(STAGE_BUCKETS_S)
+            histogram.observe(seconds)
+    
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as one run of an ingestion stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+    
+    def timed_iter(self, iterable: Iterable[T], stage: str) -> Iterator[T]:
+        """
+        Pass items through, timing how long the iterable takes to produce them.
+        
+        The time spent inside the iterable (not in the consumer) is recorded
+        as one run of stage when iteration finishes or stops early.
+        """
+        busy = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    busy += time.perf_counter() - start
+                    return
+                busy += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe_stage(stage, busy)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "latency_ms": self.latency_ms.snapshot(),
+                "texts_per_call": self.texts_per_call.snapshot(),
+                "chars_per_call": self.chars_per_call.snapshot(),
+                "stage_seconds": {name: histogram.snapshot() for name, histogram in self.stages.items()}
+            }
+    
+    def to_json(self) -> str:
+        """Return snapshot() as a JSON string"""
+        return json.dumps(self.snapshot())
+    
+    def to_prometheus(self, prefix: str = "embedding") -> str:
+        """Return all metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        
+        def histogram_lines(name: str, histogram: Histogram, labels: str = "") -> None:
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{{{labels + ',' if labels else ''}{le}}} {cumulative}")
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {histogram.sum}")
+            lines.append(f"{name}_count{suffix} {histogram.count}")
+        
+        with self._lock:
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            lines.append(f"# TYPE {prefix}_in_flight gauge")
+            lines.append(f"{prefix}_in_flight {self.in_flight}")
+            for name, histogram in (
+                ("latency_ms", self.latency_ms),
+                ("texts_per_call", self.texts_per_call),
+                ("chars_per_call", self.chars_per_call)
+            ):
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                histogram_lines(f"{prefix}_{name}", histogram)
+            if self.stages:
+                lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+                for stage, histogram in self.stages.items():
+                    histogram_lines(f"{prefix}_stage_seconds", histogram, f'stage="{stage}"')
+        return "\n".join(lines) + "\n"
+
+# Shared by every embedder, cache and ingest pipeline in the process
+embedding_metrics = EmbeddingMetrics()
@@ -3,6 +3,7 @@ from langchain.llms import Cohere
 from langchain.prompts import PromptTemplate
 from langchain.chains.question_answering import load_qa_chain
 import os
+from retrievers import get_retriever
 
 def get_qa_chain(vectorstore, detail_level):
     cohere_key = os.getenv("COHERE_API_KEY")
@@ -170,10 +171,9 @@ DETAILED ANSWER:"""
         cohere_api_key=cohere_key
     )
     
-    # Configure the retriever to get more context
-    retriever = vectorstore.as_retriever(
-        search_kwargs={"k": 5}  # Retrieve top 5 most relevant chunks
-    )
+    # Configure the retriever to get more context: top 5 chunks by
+    # BM25 + vector search (or vector search only, see RETRIEVAL_MODE)
+    retriever = get_retriever(vectorstore, k=5)
     
     # Create the QA chain
     qa_chain = load_qa_chain(
@@ -0,0 +1,304 @@
+import os
+import json
+import pickle
+from typing import List, Dict, Any, Optional, Tuple, Callable, Union
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from columnar_docstore import ColumnarDocstore
+
+# Embedding type requested from the API and stored in the index:
+# "float" (4 bytes per dimension), "int8" (1 byte) or "binary" (1 bit)
+EMBEDDING_TYPE = os.getenv("EMBEDDING_TYPE", "float")
+
+# Compressed stores fetch this many times k candidates and rescore them
+# against the float query; 0 disables rescoring
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", 4))
+
+EMBEDDING_TYPES = ("float", "int8", "binary")
+
+# dtype of one row of embeddings of each type; binary rows are packed bits
+EMBEDDING_DTYPES = {"float": np.float32, "int8": np.int8, "binary": np.uint8}
+
+# Written next to the index of a compressed store so it can be reloaded
+_QUANTIZATION_FILE = "quantization.json"
+
+# An 8-bit scalar quantizer trained on this range stores int8 values exactly
+# (reconstructed half a step high) and, unlike the "direct" quantizers,
+# searches with an unquantized float query
+_INT8_RANGE = np.array([[-128], [127]], dtype=np.float32)
+
+def check_embedding_type(embedding_type: str) -> None:
+    """Raise ValueError if embedding_type is not one of EMBEDDING_TYPES"""
+    if embedding_type not in EMBEDDING_TYPES:
+        raise ValueError(f"Unsupported embedding type: {embedding_type} (expected one of {', '.join(EMBEDDING_TYPES)})")
+
+def quantize(vectors: np.ndarray, embedding_type: str) -> np.ndarray:
+    """
+    Compress float embeddings locally, for embedders that only return floats.
+    
+    int8 scales each row so its largest component maps to 127; binary keeps
+    the sign of each component, packed 8 dimensions per byte.
+    
+    Args:
+        vectors: float32 array with one embedding per row
+        embedding_type: Target type, one of EMBEDDING_TYPES
+    
+    Returns:
+        np.ndarray: Array of EMBEDDING_DTYPES[embedding_type] with one row per embedding
+    """
+    check_embedding_type(embedding_type)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if embedding_type == "int8":
+        scale = np.abs(vectors).max(axis=1, keepdims=True)
+        scale[scale == 0] = 1
+        return np.rint(vectors * (127 / scale)).astype(np.int8)
+    if embedding_type == "binary":
+        return np.packbits(vectors > 0, axis=1)
+    return vectors
+
+def dequantize(codes: np.ndarray, embedding_type: str) -> np.ndarray:
+    """Map stored int8 or binary codes back to float32 vectors (binary bits become +1/-1)"""
+    if embedding_type == "binary":
+        return np.unpackbits(codes, axis=1).astype(np.float32) * 2 - 1
+    return codes.astype(np.float32)
+
+def create_index(vectors: np.ndarray, embedding_type: str) -> Any:
+    """
+    Build a FAISS index matching the embedding type.
+    
+    Args:
+        vectors: Embeddings with one row per chunk, of EMBEDDING_DTYPES[embedding_type]
+        embedding_type: One of EMBEDDING_TYPES
+    
+    Returns:
+        Any: IndexFlatL2 for float, an 8-bit IndexScalarQuantizer for int8
+            (1 byte per dimension) or an IndexBinaryFlat for binary (1 bit
+            per dimension)
+    """
+    check_embedding_type(embedding_type)
+    if embedding_type == "binary":
+        index = faiss.IndexBinaryFlat(vectors.shape[1] * 8)
+        index.add(np.ascontiguousarray(vectors, dtype=np.uint8))
+    elif embedding_type == "int8":
+        index = faiss.IndexScalarQuantizer(
+            vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(np.repeat(_INT8_RANGE, vectors.shape[1], axis=1))
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    else:
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    return index
+
+def merge_docstores(vectorstore: FAISS, target: FAISS, starting_len: int) -> None:
+    """
+    Add target's documents to vectorstore after its vectors were appended.
+    
+    For stores whose index cannot use FAISS.merge_from directly.
+    
+    Args:
+        vectorstore: Store being merged into
+        target: Store being merged from
+        starting_len: Number of entries in vectorstore before the merge
+    """
+    if isinstance(vectorstore.docstore, ColumnarDocstore) and isinstance(target.docstore, ColumnarDocstore):
+        # Copy the columns without building a Document per chunk
+        vectorstore.docstore.extend(target.docstore)
+        for i, target_id in target.index_to_docstore_id.items():
+            vectorstore.index_to_docstore_id[starting_len + i] = target_id
+        return
+    
+    docs = {}
+    for i, target_id in target.index_to_docstore_id.items():
+        doc = target.docstore.search(target_id)
+        if not isinstance(doc, Document):
+            raise ValueError("Document should be returned")
+        docs[target_id] = doc
+        vectorstore.index_to_docstore_id[starting_len + i] = target_id
+    vectorstore.docstore.add(docs)
+
+class QuantizedFAISS(FAISS):
+    """
+    FAISS vector store over int8 or binary embeddings.
+    
+    Queries are embedded as floats. The int8 index is searched by inner
+    product between the float query and the stored codes; the binary index
+    by Hamming distance to the query's sign bits. When rescore_factor is
+    set, rescore_factor * k candidates are fetched and re-ranked by the
+    cosine similarity between the float query and each candidate's
+    dequantized code, which recovers most of the ranking quality lost to
+    compression without keeping float vectors around. Scores are
+    similarities: higher is better.
+    """
+    
+    def __init__(
+        self,
+        embedding_function: Union[Callable[[str], List[float]], Embeddings],
+        index: Any,
+        docstore: Any,
+        index_to_docstore_id: Dict[int, str],
+        embedding_type: str = "int8",
+        rescore_factor: int = RESCORE_FACTOR,
+        **kwargs: Any
+    ):
+        kwargs.setdefault("distance_strategy", DistanceStrategy.MAX_INNER_PRODUCT)
+        super().__init__(embedding_function, index, docstore, index_to_docstore_id, **kwargs)
+        self.embedding_type = embedding_type
+        self.rescore_factor = rescore_factor
+    
+    def _codes(self, ids: np.ndarray) -> np.ndarray:
+        """Return the stored codes of the given index positions"""
+        if self.embedding_type == "binary":
+            return np.stack([self.index.reconstruct(int(i)) for i in ids])
+        return np.floor(self.index.reconstruct_batch(ids)).astype(np.int8)
+    
+    def reconstruct_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Return the dequantized vectors stored at the given index positions"""
+        return dequantize(self._codes(ids), self.embedding_type)
+    
+    def _search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the compressed index, returning similarities and positions"""
+        if self.embedding_type == "binary":
+            distances, indices = self.index.search(np.packbits(query > 0, axis=1), k)
+            # Dot product of the two sign vectors
+            return self.index.d - 2 * distances.astype(np.float32), indices
+        scores, indices = self.index.search(query, k)
+        # Codes are reconstructed half a step high
+        return scores - 0.5 * query.sum(), indices
+    
+    def _rescore(self, query: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """Cosine similarity between the float query and the dequantized candidates"""
+        vectors = dequantize(self._codes(indices), self.embedding_type)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        norms[norms == 0] = 1
+        return vectors @ query[0] / norms
+    
+    def search_ids(self, query: np.ndarray, k: int, rescore: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search for the k stored codes most similar to a query.
+        
+        Args:
+            query: float32 array holding one query
+            k: Number of results
+            rescore: Whether to re-rank rescore_factor * k candidates with
+                the dequantized codes
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Similarities and index positions
+                of up to k results, best first
+        """
+        candidates = k * self.rescore_factor if rescore and self.rescore_factor else k
+        scores, indices = self._search(query, min(candidates, self.index.ntotal))
+        
+        found = indices[0] != -1
+        scores, indices = scores[0][found], indices[0][found]
+        if candidates != k and len(indices):
+            scores = self._rescore(query, indices)
+            order = np.argsort(-scores, kind="stable")
+            scores, indices = scores[order], indices[order]
+        return scores, indices
+    
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the docs most similar to a query vector, with similarity scores.
+        
+        Args:
+            embedding: Float embedding of the query
+            k: Number of documents to return
+            filter: Optional metadata filter (dict or callable)
+            fetch_k: Number of candidates fetched before filtering
+            **kwargs: May include score_threshold, the minimum similarity kept
+        
+        Returns:
+            List[Tuple[Document, float]]: Documents and their similarity, best first
+        """
+        query = np.array([embedding], dtype=np.float32)
+        scores, indices = self.search_ids(query, k if filter is None else fetch_k)
+        
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+        
+        docs = []
+        for score, i in zip(scores, indices):
+            _id = self.index_to_docstore_id[int(i)]
+            doc = self.docstore.search(_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {_id}, got {doc}")
+            if filter is None or filter_func(doc.metadata):
+                docs.append((doc, float(score)))
+        
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            docs = [(doc, score) for doc, score in docs if score >= score_threshold]
+        return docs[:k]
+    
+    def merge_from(self, target: FAISS) -> None:
+        """Merge another store of the same embedding type into this one"""
+        if not isinstance(self.index, faiss.IndexBinary):
+            super().merge_from(target)
+            return
+        
+        # IndexBinaryFlat has no merge_from, so append the target's codes
+        starting_len = len(self.index_to_docstore_id)
+        codes = faiss.vector_to_array(target.index.xb).reshape(target.index.ntotal, -1)
+        self.index.add(codes)
+        merge_docstores(self, target, starting_len)
+    
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        """Save the index, docstore and quantization settings to folder_path"""
+        os.makedirs(folder_path, exist_ok=True)
+        index_path = os.path.join(folder_path, f"{index_name}.faiss")
+        if isinstance(self.index, faiss.IndexBinary):
+            faiss.write_index_binary(self.index, index_path)
+        else:
+            faiss.write_index(self.index, index_path)
+        
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "wb") as f:
+            pickle.dump((self.docstore, self.index_to_docstore_id), f)
+        with open(os.path.join(folder_path, _QUANTIZATION_FILE), "w") as f:
+            json.dump({"embedding_type": self.embedding_type, "rescore_factor": self.rescore_factor}, f)
+    
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings: Embeddings,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        io_flags: int = 0,
+        **kwargs: Any
+    ) -> "QuantizedFAISS":
+        """Load a store written by save_local; the pickle is only read when explicitly allowed, io_flags are passed to FAISS"""
+        if not allow_dangerous_deserialization:
+            raise ValueError("Loading a vector store unpickles data; pass allow_dangerous_deserialization=True for trusted files")
+        
+        with open(os.path.join(folder_path, _QUANTIZATION_FILE)) as f:
+            settings = json.load(f)
+        index_path = os.path.join(folder_path, f"{index_name}.faiss")
+        if settings["embedding_type"] == "binary":
+            index = faiss.read_index_binary(index_path, io_flags)
+        else:
+            index = faiss.read_index(index_path, io_flags)
+        
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        kwargs.setdefault("embedding_type", settings["embedding_type"])
+        kwargs.setdefault("rescore_factor", settings["rescore_factor"])
+        return cls(embeddings, index, docstore, index_to_docstore_id, **kwargs)
+
+def is_quantized(folder_path: str) -> bool:
+    """Whether folder_path holds a store saved by QuantizedFAISS"""
+    return os.path.exists(os.path.join(folder_path, _QUANTIZATION_FILE))
@@ -0,0 +1,413 @@
+import os
+import json
+import pickle
+import shutil
+import weakref
+import tempfile
+from typing import List, Dict, Any, Optional, Tuple, Callable, Union
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from quantization import RESCORE_FACTOR, merge_docstores
+from index_factory import build_index
+
+# Dimensionality reduction of stored vectors: "none", "pca" or "random"
+REDUCTION = os.getenv("REDUCTION", "none")
+REDUCTION_DIMENSIONS = int(os.getenv("REDUCTION_DIMENSIONS", 256))
+
+# Optional projection fitted once over a corpus (see Projection.save) and
+# used for every document instead of fitting one per document
+REDUCTION_PROJECTION = os.getenv("REDUCTION_PROJECTION")
+
+# Full-dimensional vectors of reduced stores live in files here and are
+# memory-mapped for rescoring
+REDUCED_VECTORS_DIR = os.getenv("REDUCED_VECTORS_DIR", ".vectors")
+
+REDUCTIONS = ("none", "pca", "random")
+
+# Most vectors used to fit a PCA; a sample is enough for the top components
+_PCA_SAMPLE = 20_000
+
+# Measure recall against exact search (see measure_recall) after every
+# reduced build; off by default, since the exact search reads every
+# full-dimensional vector
+REDUCTION_MEASURE_RECALL = os.getenv("REDUCTION_MEASURE_RECALL", "0") != "0"
+
+# Number of stored vectors used as queries when measuring recall
+_RECALL_QUERIES = 100
+
+_REDUCTION_FILE = "reduction.json"
+_VECTORS_FILE = "vectors.f32"
+
+class Projection:
+    """
+    Linear map from full embeddings to a lower-dimensional space.
+    
+    PCA keeps the directions of largest variance of the vectors it is
+    fitted on; a random projection is a scaled Gaussian matrix that
+    approximately preserves distances (Johnson-Lindenstrauss) and depends
+    only on the dimensions and seed, so it is global by construction.
+    """
+    
+    def __init__(self, method: str, matrix: np.ndarray, mean: np.ndarray):
+        self.method = method
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+    
+    @property
+    def input_dimensions(self) -> int:
+        return self.matrix.shape[0]
+    
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+    
+    @classmethod
+    def fit(cls, vectors: np.ndarray, method: str, dimensions: int, seed: int = 0) -> "Projection":
+        """
+        Fit a projection to vectors.
+        
+        Args:
+            vectors: float32 array with one embedding per row
+            method: "pca" or "random"
+            dimensions: Output dimensions
+            seed: Seed of the random projection (and of the PCA sample)
+        
+        Returns:
+            Projection: The fitted projection
+        
+        Raises:
+            ValueError: If method is not "pca" or "random", or if PCA is
+                given fewer vectors than dimensions
+        """
+        rng = np.random.default_rng(seed)
+        full = vectors.shape[1]
+        if method == "random":
+            matrix = rng.standard_normal((full, dimensions), dtype=np.float32) / np.sqrt(dimensions)
+            return cls(method, matrix, np.zeros(full, dtype=np.float32))
+        if method != "pca":
+            raise ValueError(f"Unsupported reduction: {method} (expected one of {', '.join(REDUCTIONS)})")
+        if len(vectors) < dimensions:
+            raise ValueError(
+                f"PCA to {dimensions} dimensions needs at least {dimensions} vectors, got {len(vectors)}; "
+                "lower REDUCTION_DIMENSIONS or set REDUCTION_PROJECTION to a projection fitted on a larger corpus"
+            )
+        
+        sample = vectors
+        if len(vectors) > _PCA_SAMPLE:
+            sample = vectors[np.sort(rng.choice(len(vectors), _PCA_SAMPLE, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        mean = sample.mean(axis=0)
+        # Rows of vt are the principal directions, largest variance first
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        return cls(method, vt[:dimensions].T, mean)
+    
+    def same_as(self, other: "Projection") -> bool:
+        """Whether other maps vectors exactly as this projection does"""
+        return other is self or (
+            np.array_equal(self.matrix, other.matrix) and np.array_equal(self.mean, other.mean)
+        )
+    
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Project vectors (one per row) into the reduced space"""
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.matrix
+    
+    def save(self, path: str) -> None:
+        """Write the projection to an .npz file"""
+        with open(path, "wb") as f:
+            np.savez(f, method=self.method, matrix=self.matrix, mean=self.mean)
+    
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        """Read a projection written by save"""
+        with np.load(path) as data:
+            return cls(str(data["method"]), data["matrix"], data["mean"])
+
+_global_projection: Optional[Projection] = None
+
+def global_projection() -> Optional[Projection]:
+    """Return the projection configured by REDUCTION_PROJECTION, loading it on first use"""
+    global _global_projection
+    if _global_projection is None and REDUCTION_PROJECTION:
+        _global_projection = Projection.load(REDUCTION_PROJECTION)
+    return _global_projection
+
+def _write_vectors(vectors: np.ndarray, path: Optional[str] = None) -> str:
+    """Write float32 rows to path (a new file in REDUCED_VECTORS_DIR by default)"""
+    if path is None:
+        os.makedirs(REDUCED_VECTORS_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".f32", dir=REDUCED_VECTORS_DIR)
+        os.close(fd)
+    np.ascontiguousarray(vectors, dtype=np.float32).tofile(path)
+    return path
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class ReducedFAISS(FAISS):
+    """
+    FAISS vector store searched in a reduced space and rescored with full vectors.
+    
+    The in-memory index holds only the projected vectors. The full vectors
+    are kept in a file that is memory-mapped, so only the rows of the
+    candidates being rescored are paged in. A search fetches
+    rescore_factor * k candidates by L2 distance in the reduced space and
+    re-ranks them by exact L2 distance between the full query and full
+    vectors; scores are those exact distances, as for a flat FAISS store.
+    """
+    
+    def __init__(
+        self,
+        embedding_function: Union[Callable[[str], List[float]], Embeddings],
+        index: Any,
+        docstore: Any,
+        index_to_docstore_id: Dict[int, str],
+        projection: Projection,
+        vectors_path: str,
+        rescore_factor: int = RESCORE_FACTOR,
+        owns_vectors: bool = False,
+        **kwargs: Any
+    ):
+        super().__init__(embedding_function, index, docstore, index_to_docstore_id, **kwargs)
+        self.projection = projection
+        self.rescore_factor = rescore_factor
+        self.reduction_stats: Dict[str, Any] = {}
+        self._open_vectors(vectors_path, owns_vectors)
+    
+    def _open_vectors(self, path: str, owns: bool) -> None:
+        self.vectors_path = path
+        self.owns_vectors = owns
+        self.vectors = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, self.projection.input_dimensions)
+        if owns:
+            # Delete the file once the store is garbage collected
+            self._finalizer = weakref.finalize(self, _remove, path)
+    
+    @classmethod
+    def from_vectors(
+        cls,
+        embeddings: Embeddings,
+        vectors: np.ndarray,
+        docstore: Any,
+        index_to_docstore_id: Dict[int, str],
+        projection: Projection,
+        rescore_factor: int = RESCORE_FACTOR,
+        index_spec: Optional[Dict[str, Any]] = None
+    ) -> "ReducedFAISS":
+        """Build a store from full vectors: write them to disk and index their projections (flat unless index_spec says otherwise)"""
+        projected = projection.transform(vectors)
+        if index_spec is None:
+            index = faiss.IndexFlatL2(projection.dimensions)
+            index.add(projected)
+        else:
+            index = build_index(projected, index_spec)
+        return cls(
+            embeddings, index, docstore, index_to_docstore_id, projection,
+            _write_vectors(vectors), rescore_factor, owns_vectors=True
+        )
+    
+    def reconstruct_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Return the full-dimensional vectors stored at the given index positions"""
+        # Sorted ids read the memory-mapped file sequentially
+        order = np.argsort(ids, kind="stable")
+        vectors = np.empty((len(ids), self.vectors.shape[1]), dtype=np.float32)
+        vectors[order] = self.vectors[ids[order]]
+        return vectors
+    
+    def search_ids(self, query: np.ndarray, k: int, rescore: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search for the k nearest stored vectors to each query.
+        
+        Args:
+            query: float32 array of full-dimensional queries, one per row
+            k: Number of results per query
+            rescore: Whether to re-rank candidates with the full vectors
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Squared L2 distances and index
+                positions, each of shape (len(query), k); missing results are -1
+        """
+        candidates = k * self.rescore_factor if rescore and self.rescore_factor else k
+        distances, indices = self.index.search(self.projection.transform(query), min(candidates, self.index.ntotal))
+        if candidates == k:
+            return distances, indices
+        
+        out_distances = np.full((len(query), k), np.inf, dtype=np.float32)
+        out_indices = np.full((len(query), k), -1, dtype=np.int64)
+        for row, ids in enumerate(indices):
+            ids = ids[ids != -1]
+            # Sorted ids read the memory-mapped file sequentially
+            ids = np.sort(ids)
+            exact = ((self.vectors[ids] - query[row]) ** 2).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            out_distances[row, :len(order)] = exact[order]
+            out_indices[row, :len(order)] = ids[order]
+        return out_distances, out_indices
+    
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the docs most similar to a query vector, with L2 distances.
+        
+        Args:
+            embedding: Full-dimensional embedding of the query
+            k: Number of documents to return
+            filter: Optional metadata filter (dict or callable)
+            fetch_k: Number of candidates fetched before filtering
+            **kwargs: May include score_threshold, the largest distance kept
+        
+        Returns:
+            List[Tuple[Document, float]]: Documents and their distance, nearest first
+        """
+        query = np.array([embedding], dtype=np.float32)
+        distances, indices = self.search_ids(query, k if filter is None else fetch_k)
+        
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+        
+        docs = []
+        for distance, i in zip(distances[0], indices[0]):
+            if i == -1:
+                continue
+            _id = self.index_to_docstore_id[int(i)]
+            doc = self.docstore.search(_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {_id}, got {doc}")
+            if filter is None or filter_func(doc.metadata):
+                docs.append((doc, float(distance)))
+        
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            docs = [(doc, distance) for doc, distance in docs if distance <= score_threshold]
+        return docs[:k]
+    
+    def merge_from(self, target: FAISS) -> None:
+        """
+        Merge another reduced store into this one.
+        
+        The target's full vectors are appended to this store's file and
+        projected with this store's projection, so both stores must use the
+        same projection (REDUCTION_PROJECTION, or the same random one). To
+        combine stores reduced separately, merge them unreduced and reduce
+        the result (see vectorstore.reduce_vectorstore).
+        
+        Raises:
+            ValueError: If target is not a reduced store or uses another projection
+        """
+        if not isinstance(target, ReducedFAISS):
+            raise ValueError("Can only merge a reduced vector store into a reduced vector store")
+        if not self.projection.same_as(target.projection):
+            raise ValueError("Cannot merge reduced vector stores with different projections")
+        
+        if not self.owns_vectors:
+            # Never append to a file this store only borrows (e.g. a cache entry)
+            self._open_vectors(_write_vectors(self.vectors), True)
+        
+        starting_len = len(self.index_to_docstore_id)
+        self.index.add(self.projection.transform(target.vectors))
+        with open(self.vectors_path, "ab") as f:
+            np.ascontiguousarray(target.vectors, dtype=np.float32).tofile(f)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.projection.input_dimensions)
+        merge_docstores(self, target, starting_len)
+    
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        """Save the reduced index, docstore, projection and full vectors to folder_path"""
+        os.makedirs(folder_path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(folder_path, f"{index_name}.faiss"))
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "wb") as f:
+            pickle.dump((self.docstore, self.index_to_docstore_id), f)
+        self.projection.save(os.path.join(folder_path, "projection.npz"))
+        shutil.copyfile(self.vectors_path, os.path.join(folder_path, _VECTORS_FILE))
+        with open(os.path.join(folder_path, _REDUCTION_FILE), "w") as f:
+            json.dump({"method": self.projection.method, "rescore_factor": self.rescore_factor}, f)
+    
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings: Embeddings,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        io_flags: int = 0,
+        **kwargs: Any
+    ) -> "ReducedFAISS":
+        """Load a store written by save_local; its full vectors are memory-mapped in place, io_flags are passed to FAISS"""
+        if not allow_dangerous_deserialization:
+            raise ValueError("Loading a vector store unpickles data; pass allow_dangerous_deserialization=True for trusted files")
+        
+        with open(os.path.join(folder_path, _REDUCTION_FILE)) as f:
+            settings = json.load(f)
+        index = faiss.read_index(os.path.join(folder_path, f"{index_name}.faiss"), io_flags)
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        projection = Projection.load(os.path.join(folder_path, "projection.npz"))
+        
+        kwargs.setdefault("rescore_factor", settings["rescore_factor"])
+        return cls(
+            embeddings, index, docstore, index_to_docstore_id, projection,
+            os.path.join(folder_path, _VECTORS_FILE), **kwargs
+        )
+
+def is_reduced(folder_path: str) -> bool:
+    """Whether folder_path holds a store saved by ReducedFAISS"""
+    return os.path.exists(os.path.join(folder_path, _REDUCTION_FILE))
+
+def measure_recall(vectorstore: ReducedFAISS, k: int = 5, queries: int = _RECALL_QUERIES, seed: int = 0) -> Dict[str, Any]:
+    """
+    Compare a reduced store's neighbours with exact search over the full vectors.
+    
+    A sample of stored vectors is used as queries and each query's own
+    entry is excluded, so recall measures how many of its true k nearest
+    neighbours the reduced search finds, with and without rescoring.
+    
+    Args:
+        vectorstore: Reduced store to evaluate
+        k: Neighbours per query
+        queries: Maximum number of sampled queries
+        seed: Seed used to sample the queries
+    
+    Returns:
+        Dict[str, Any]: Dimensions, sample size and recall@k with and
+            without rescoring
+    """
+    total = vectorstore.index.ntotal
+    stats = {
+        "method": vectorstore.projection.method,
+        "input_dimensions": vectorstore.projection.input_dimensions,
+        "dimensions": vectorstore.projection.dimensions,
+        "queries": 0
+    }
+    if total <= k + 1:
+        return stats
+    
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(total, min(queries, total), replace=False))
+    query = np.asarray(vectorstore.vectors[sample])
+    
+    exact = faiss.IndexFlatL2(query.shape[1])
+    exact.add(np.asarray(vectorstore.vectors))
+    _, truth = exact.search(query, k + 1)
+    
+    def recall(indices: np.ndarray) -> float:
+        hits = 0
+        for own, true_ids, found_ids in zip(sample, truth, indices):
+            true_ids = set(true_ids[true_ids != own][:k].tolist())
+            found_ids = set(found_ids[found_ids != own][:k].tolist())
+            hits += len(true_ids & found_ids)
+        return round(hits / (k * len(sample)), 4)
+    
+    stats["queries"] = len(sample)
+    stats[f"recall@{k}_reduced"] = recall(vectorstore.search_ids(query, k + 1, rescore=False)[1])
+    stats[f"recall@{k}"] = recall(vectorstore.search_ids(query, k + 1)[1])
+    return stats
@@ -0,0 +1,319 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from bm25 import BM25Index
+
+logger = logging.getLogger(__name__)
+
+# Retrieval used by the QA chain: "hybrid" (BM25 + vectors), "dense" or
+# "mmr" (vectors, diversified by maximal marginal relevance)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# Reciprocal rank fusion constant; larger values flatten the rank weights
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Candidates taken from each ranking before fusion
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", 20))
+
+# MMR trade-off: 1 ranks by relevance only, 0 by diversity only
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.5))
+
+# Nearest chunks re-ranked by MMR
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", 20))
+
+# Seconds to wait for a remote query embedding before the hybrid and MMR
+# retrievers answer from BM25 alone; 0 waits indefinitely
+QUERY_EMBED_TIMEOUT = float(os.getenv("QUERY_EMBED_TIMEOUT", 5))
+
+RETRIEVAL_MODES = ("hybrid", "dense", "mmr")
+
+_direct_map_lock = threading.Lock()
+
+# Serializes the one-off BM25 builds of stores shared between sessions
+_bm25_lock = threading.Lock()
+
+_query_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+def get_bm25(vectorstore: FAISS) -> BM25Index:
+    """
+    Return the store's BM25 index, building it from the docstore if it has none.
+    
+    Stores built by create_vectorstore carry one already; stores saved
+    before BM25 indexes existed get one on first use. The build runs under
+    a lock, so sessions sharing a store through the index registry build
+    it once and never see a partly built index.
+    """
+    bm25 = getattr(vectorstore, "bm25", None)
+    if bm25 is not None:
+        return bm25
+    with _bm25_lock:
+        bm25 = getattr(vectorstore, "bm25", None)
+        if bm25 is None:
+            texts = (
+                vectorstore.docstore.search(doc_id).page_content
+                for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+            )
+            bm25 = vectorstore.bm25 = BM25Index.from_texts(texts)
+    return bm25
+
+def embed_query(vectorstore: FAISS, query: str, timeout: float = QUERY_EMBED_TIMEOUT) -> Optional[List[float]]:
+    """
+    Embed a query with the store's own embeddings, giving up after timeout seconds.
+    
+    Only the embeddings the store was built with produce comparable
+    vectors, so a slow remote backend cannot be swapped for a local one
+    per query; callers fall back to the store's BM25 ranking instead.
+    Local embedders are called directly. A remote call that misses the
+    deadline keeps running in the background, so its result still reaches
+    the query cache for the next identical question.
+    
+    Args:
+        vectorstore: Store whose embedding_function embeds the query
+        query: Query text
+        timeout: Seconds to wait; 0 waits indefinitely
+    
+    Returns:
+        Optional[List[float]]: The query vector, or None on timeout
+    """
+    embeddings = vectorstore.embedding_function
+    if timeout <= 0 or getattr(embeddings, "local", False):
+        return embeddings.embed_query(query)
+    future = _query_embed_executor.submit(embeddings.embed_query, query)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        logger.warning(f"Query embedding took over {timeout}s, answering from BM25 only")
+        return None
+
+def search_ids(vectorstore: FAISS, embedding: List[float], k: int) -> np.ndarray:
+    """
+    Return the index positions of the k nearest chunks to a query vector, best first.
+    
+    Uses the store's own search (with rescoring for compressed and
+    reduced stores) without looking up documents.
+    """
+    query = np.array([embedding], dtype=np.float32)
+    k = min(k, vectorstore.index.ntotal)
+    if hasattr(vectorstore, "search_ids"):
+        _, indices = vectorstore.search_ids(query, k)
+    else:
+        _, indices = vectorstore.index.search(query, k)
+    indices = np.asarray(indices).reshape(-1)
+    return indices[indices != -1]
+
+def stored_vectors(vectorstore: FAISS, positions: np.ndarray) -> np.ndarray:
+    """
+    Return the vectors stored at the given index positions, without re-embedding.
+    
+    Compressed stores return their dequantized codes and reduced stores
+    their full-dimensional vectors. IVF indexes saved without a direct map
+    get one on first use.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if hasattr(vectorstore, "reconstruct_vectors"):
+        return vectorstore.reconstruct_vectors(positions)
+    index = vectorstore.index
+    try:
+        return index.reconstruct_batch(positions)
+    except RuntimeError:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            raise
+        with _direct_map_lock:
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+        return index.reconstruct_batch(positions)
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = MMR_LAMBDA
+) -> np.ndarray:
+    """
+    Select k candidates by maximal marginal relevance.
+    
+    Each step picks the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, selected))
+    with cosine similarities. The candidate similarities are one matrix
+    product and each candidate's redundancy is updated in place as the
+    selection grows, so a step is a few array operations.
+    
+    Args:
+        query: Query vector
+        vectors: Candidate vectors, one per row
+        k: Number of candidates to select
+        lambda_mult: 1 ranks by relevance only, 0 by diversity only
+    
+    Returns:
+        np.ndarray: Rows of the selected candidates, in selection order
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors = vectors / norms
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    relevance = vectors @ (query / (np.linalg.norm(query) or 1))
+    similarity = vectors @ vectors.T
+    
+    selected = np.empty(k, dtype=np.int64)
+    selected[0] = np.argmax(relevance)
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(vectors), dtype=bool)
+    available[selected[0]] = False
+    for step in range(1, k):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = np.argmax(scores)
+        selected[step] = best
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+def mmr_search_ids(
+    vectorstore: FAISS,
+    embedding: List[float],
+    k: int,
+    fetch_k: int = MMR_FETCH_K,
+    lambda_mult: float = MMR_LAMBDA
+) -> np.ndarray:
+    """
+    Return the index positions of k diverse chunks for a query vector.
+    
+    The fetch_k nearest chunks are re-ranked by maximal marginal relevance
+    using the vectors already stored in the index.
+    """
+    candidates = search_ids(vectorstore, embedding, max(fetch_k, k))
+    if len(candidates) <= 1:
+        return candidates
+    return candidates[maximal_marginal_relevance(embedding, stored_vectors(vectorstore, candidates), k, lambda_mult)]
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    Fuse rankings of index positions by reciprocal rank.
+    
+    Each position scores sum(1 / (k + rank)) over the rankings that
+    contain it (rank starting at 1), so items ranked well by either
+    retriever rise without having to calibrate their scores.
+    
+    Args:
+        rankings: Arrays of positions, best first
+        k: RRF constant
+    
+    Returns:
+        List[Tuple[int, float]]: Positions and fused scores, best first
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking.tolist(), start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses BM25 and vector search with reciprocal rank fusion.
+    
+    Dense search finds paraphrases; BM25 finds exact identifiers, part
+    numbers and codes that embeddings blur. fetch_k candidates are taken
+    from each and the top k after fusion are returned. If the query
+    embedding misses QUERY_EMBED_TIMEOUT, the BM25 ranking is used alone.
+    """
+    
+    vectorstore: Any
+    k: int = 5
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vectorstore = self.vectorstore
+        _, sparse = get_bm25(vectorstore).search(query, self.fetch_k)
+        rankings = [sparse]
+        embedding = embed_query(vectorstore, query)
+        if embedding is not None:
+            rankings.insert(0, search_ids(vectorstore, embedding, self.fetch_k))
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)
+        return [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            for position, _ in fused[:self.k]
+        ]
+
+class MMRRetriever(BaseRetriever):
+    """
+    Retriever that diversifies vector search results by maximal marginal relevance.
+    
+    The fetch_k nearest chunks are re-ranked with the vectors stored in the
+    index, so a passage and its overlapping neighbour chunks do not fill
+    the whole context. The query is embedded once, as for plain top-k
+    search (see benchmarks/bench_retrieval.py for the latency overhead).
+    If the embedding misses QUERY_EMBED_TIMEOUT, the BM25 top k are
+    returned instead.
+    """
+    
+    vectorstore: Any
+    k: int = 5
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+    
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vectorstore = self.vectorstore
+        embedding = embed_query(vectorstore, query)
+        if embedding is None:
+            _, positions = get_bm25(vectorstore).search(query, self.k)
+        else:
+            positions = mmr_search_ids(vectorstore, embedding, self.k, self.fetch_k, self.lambda_mult)
+        return [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            for position in positions.tolist()
+        ]
+
+def get_retriever(
+    vectorstore: FAISS,
+    k: int = 5,
+    mode: str = RETRIEVAL_MODE,
+    mmr_lambda: float = MMR_LAMBDA
+) -> BaseRetriever:
+    """
+    Build the retriever used by the QA chain.
+    
+    Args:
+        vectorstore: Vector store to retrieve from
+        k: Number of chunks returned per query
+        mode: "hybrid" for BM25 + vector search fused by RRF, "dense" for
+            vector search only, "mmr" for vector search diversified by MMR
+        mmr_lambda: MMR relevance / diversity trade-off ("mmr" mode only)
+    
+    Returns:
+        BaseRetriever: The retriever
+    
+    Raises:
+        ValueError: If mode is not one of RETRIEVAL_MODES
+    """
+    if mode == "hybrid":
+        return HybridRetriever(vectorstore=vectorstore, k=k)
+    if mode == "dense":
+        return vectorstore.as_retriever(search_kwargs={"k": k})
+    if mode == "mmr":
+        return MMRRetriever(vectorstore=vectorstore, k=k, lambda_mult=mmr_lambda)
+    raise ValueError(f"Unsupported retrieval mode: {mode} (expected one of {', '.join(RETRIEVAL_MODES)})")
@@ -1,25 +1,383 @@
-from typing import List, Union, BinaryIO, Optional
+from typing import List, Union, BinaryIO, Optional, Iterable, Iterator, NamedTuple, Sequence, Tuple, Deque
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import repeat
+from bisect import bisect_right
+import io
+import mmap
+import tempfile
+import codecs
 import fitz
 import pandas as pd
+from openpyxl import load_workbook
 from docx import Document
 from pptx import Presentation
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_text(file: BinaryIO, filetype: str) -> str:
+# Parallel PDF extraction settings
+PDF_PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+PDF_PAGES_PER_TASK = 16
+
+# Size of the process pool shared by the files of one ingest (see extraction_pool)
+EXTRACT_PROCESS_WORKERS = int(os.getenv("EXTRACT_PROCESS_WORKERS", os.cpu_count() or 1))
+
+# Streaming spreadsheet extraction settings
+SHEET_PARALLEL_WORKERS = int(os.getenv("SHEET_PARALLEL_WORKERS", os.cpu_count() or 1))
+SHEET_ROWS_PER_GROUP = int(os.getenv("SHEET_ROWS_PER_GROUP", 50))
+# Sheets larger than this (or without a recorded size) are streamed in the
+# calling process rather than extracted whole by a worker
+SHEET_PARALLEL_MAX_ROWS = int(os.getenv("SHEET_PARALLEL_MAX_ROWS", 20000))
+
+# Plain text extraction settings
+TEXT_BLOCK_SIZE = 1024 * 1024
+
+# Byte order marks checked before falling back to UTF-8 / cp1252 detection
+_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16")
+]
+
+# Separator used to join the segments of each file type into a single text
+SEGMENT_SEPARATORS = {
+    "pdf": "\n",
+    "docx": "\n\n",
+    "pptx": "\n",
+    "xlsx": "\n\n",
+    "xls": "\n\n",
+    "txt": "",
+    "md": ""
+}
+
+# Break points used by split_spans, in priority order
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+# Number of chunk_size windows buffered by iter_chunks before splitting
+CHUNK_WINDOW_MULTIPLIER = 8
+
+def extraction_pool(workers: int = EXTRACT_PROCESS_WORKERS) -> ProcessPoolExecutor:
     """
-    Extract text from various file formats.
+    Create a process pool for PDF and spreadsheet extraction.
+    
+    Workers are started with forkserver (spawn where it is unavailable)
+    instead of fork: extraction runs on ingest threads, and forking a
+    multithreaded process can leave locks held in the child.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def _map_in_pool(
+    executor: Optional[Executor],
+    workers: int,
+    func,
+    *iterables
+) -> Iterator:
+    """
+    Yield executor.map(func, *iterables) results in order.
+    
+    Uses the given executor, or a pool of workers processes that is shut
+    down afterwards. Tasks not yet started are cancelled if the caller
+    stops early.
+    """
+    pool = executor or extraction_pool(workers)
+    try:
+        yield from pool.map(func, *iterables)
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    Extract the text of pages [start, end) from a PDF file.
+    
+    Runs inside a worker process, so it opens its own copy of the document.
+    MuPDF reads only the objects of the requested pages from the file.
+    """
+    with fitz.open(path, filetype="pdf") as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+def _iter_pdf_pages(
+    data: bytes,
+    workers: int,
+    min_pages: int,
+    executor: Optional[Executor] = None
+) -> Iterator[str]:
+    """
+    Yield the text of every page of a PDF, in page order.
+    
+    Args:
+        data: Raw PDF bytes
+        workers: Maximum number of worker processes
+        min_pages: Page count below which extraction stays serial
+        executor: Optional shared process pool to run the page ranges on
+        
+    Yields:
+        str: Text of each page, in page order
+    """
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < min_pages:
+            for page in doc:
+                yield page.get_text()
+            return
+    
+    # Split the page range into contiguous slices; keep them small enough
+    # that the first pages reach the caller while later ones are still decoding
+    workers = min(workers, page_count)
+    step = min((page_count + workers - 1) // workers, PDF_PAGES_PER_TASK)
+    starts = list(range(0, page_count, step))
+    ends = [min(start + step, page_count) for start in starts]
+    logger.info(f"Extracting {page_count} PDF pages with {workers} workers")
+    
+    # Write the document to disk once and hand workers its path, rather
+    # than pickling the whole PDF into every task
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+        spool.write(data)
+    try:
+        # map() returns results in submission order, i.e. document order
+        for texts in _map_in_pool(executor, workers, _extract_pdf_page_range, repeat(spool.name), starts, ends):
+            yield from texts
+    finally:
+        os.remove(spool.name)
+
+def _format_row(values) -> str:
+    """Render one spreadsheet row compactly, one cell per column"""
+    return " | ".join("" if value is None else str(value).strip() for value in values)
+
+def _iter_sheet_groups(worksheet, rows_per_group: int) -> Iterator[str]:
+    """
+    Yield the rows of a read-only worksheet as compact row groups.
+    
+    The first non-empty row is treated as the header and repeated at the
+    top of every group, so each group can be understood on its own. Only
+    one group of rows is held in memory at a time.
+    
+    Args:
+        worksheet: openpyxl worksheet opened in read-only mode
+        rows_per_group: Maximum number of data rows per group
+        
+    Yields:
+        str: Row groups in sheet order
+    """
+    header = None
+    rows: List[str] = []
+    first_row = 0
+    
+    for row_number, values in enumerate(worksheet.iter_rows(values_only=True), start=1):
+        if all(value is None or str(value).strip() == "" for value in values):
+            continue
+        if header is None:
+            header = _format_row(values)
+            continue
+        if not rows:
+            first_row = row_number
+        rows.append(_format_row(values))
+        if len(rows) == rows_per_group:
+            yield f"--- Sheet: {worksheet.title} (rows {first_row}-{row_number}) ---\n{header}\n" + "\n".join(rows)
+            rows = []
+    
+    if rows:
+        yield f"--- Sheet: {worksheet.title} (rows {first_row}-{row_number}) ---\n{header}\n" + "\n".join(rows)
+    elif header is not None and first_row == 0:
+        # Header-only sheet
+        yield f"--- Sheet: {worksheet.title} ---\n{header}"
+
+def _extract_sheet_groups(data: bytes, sheet_name: str, rows_per_group: int) -> List[str]:
+    """
+    Extract the row groups of one worksheet.
+    
+    Runs inside a worker process, so it opens its own copy of the workbook.
+    """
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        return list(_iter_sheet_groups(workbook[sheet_name], rows_per_group))
+    finally:
+        workbook.close()
+
+def _iter_xlsx_groups(
+    data: bytes,
+    workers: int,
+    rows_per_group: int,
+    executor: Optional[Executor] = None,
+    max_rows: int = SHEET_PARALLEL_MAX_ROWS
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the row groups of every sheet of an XLSX workbook, in sheet order.
+    
+    Rows are read incrementally in read-only mode rather than through a
+    DataFrame. Sheets of at most max_rows rows (according to the dimension
+    record written at the top of each sheet) are extracted by worker
+    processes, with no more than workers of them running or waiting to be
+    consumed at a time. Larger or unsized sheets are streamed group by
+    group in the calling process, so memory stays bounded regardless of
+    row count.
+    
+    Args:
+        data: Raw XLSX bytes
+        workers: Maximum number of sheets extracted concurrently
+        rows_per_group: Maximum number of data rows per group
+        executor: Optional shared process pool to extract the sheets on
+        max_rows: Largest sheet handed to a worker
+        
+    Yields:
+        Tuple[int, str]: Index of the sheet and row group, in sheet order
+    """
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet_names = workbook.sheetnames
+        parallel = [
+            workers > 1 and len(sheet_names) > 1 and (workbook[name].max_row or max_rows + 1) <= max_rows
+            for name in sheet_names
+        ]
+        if not any(parallel):
+            for index, sheet_name in enumerate(sheet_names):
+                for group in _iter_sheet_groups(workbook[sheet_name], rows_per_group):
+                    yield index, group
+            return
+        
+        workers = min(workers, sum(parallel))
+        logger.info(f"Extracting {sum(parallel)} of {len(sheet_names)} sheets with {workers} workers")
+        pool = executor or extraction_pool(workers)
+        upcoming = iter([name for name, offload in zip(sheet_names, parallel) if offload])
+        pending: Deque[Future] = deque()
+        try:
+            for index, (sheet_name, offload) in enumerate(zip(sheet_names, parallel)):
+                # Submit ahead, in sheet order, up to the in-flight limit
+                while len(pending) < workers:
+                    name = next(upcoming, None)
+                    if name is None:
+                        break
+                    pending.append(pool.submit(_extract_sheet_groups, data, name, rows_per_group))
+                groups = pending.popleft().result() if offload else _iter_sheet_groups(workbook[sheet_name], rows_per_group)
+                for group in groups:
+                    yield index, group
+        finally:
+            for future in pending:
+                future.cancel()
+            if executor is None:
+                pool.shutdown(cancel_futures=True)
+    finally:
+        workbook.close()
+
+def _detect_encoding(sample: bytes) -> str:
+    """
+    Guess the encoding of a text file from its first bytes.
+    
+    Checks for a byte order mark, then whether the sample is valid UTF-8,
+    and otherwise falls back to cp1252.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+def _iter_text_blocks(file: BinaryIO, block_size: int = TEXT_BLOCK_SIZE) -> Iterator[str]:
+    """
+    Decode a plain text file incrementally from a memory map of its bytes.
+    
+    Real files are mapped with mmap; in-memory uploads (BytesIO, Streamlit's
+    UploadedFile) are read through a memoryview of their buffer. Either way
+    the raw bytes are never copied as a whole. Each yielded block ends on a
+    line break where possible, so chunk boundaries fall on whole lines, and
+    the blocks concatenate back to the full text.
+    
+    Args:
+        file: File-like object containing the text
+        block_size: Number of bytes decoded per block
+        
+    Yields:
+        str: Consecutive blocks of decoded text
+    """
+    mapped = None
+    if hasattr(file, "getbuffer"):
+        view = file.getbuffer()
+    else:
+        try:
+            size = os.fstat(file.fileno()).st_size
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            view = memoryview(mapped) if mapped is not None else memoryview(b"")
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            view = memoryview(file.read())
+    
+    try:
+        encoding = _detect_encoding(bytes(view[:4096]))
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        carry = ""
+        
+        for offset in range(0, len(view), block_size):
+            text = carry + decoder.decode(view[offset:offset + block_size])
+            cut = text.rfind("\n") + 1
+            if cut == 0 and len(text) >= block_size:
+                # No line break for a whole block: cut after the last space in
+                # the final block_size characters, or hard at the end, so the
+                # carry never grows past one block
+                start = len(text) - block_size
+                cut = max(text.rfind(" ", start), text.rfind("\t", start)) + 1 or len(text)
+            if cut == 0:
+                # No line break in this block; hold it until one arrives
+                carry = text
+                continue
+            carry = text[cut:]
+            yield text[:cut]
+        
+        text = carry + decoder.decode(b"", final=True)
+        if text:
+            yield text
+    finally:
+        view.release()
+        if mapped is not None:
+            mapped.close()
+
+class Segment(NamedTuple):
+    """A piece of extracted text and where it sits in its document"""
+    page: Optional[int]           # 1-based page (PDF) or slide (PPTX) number; None for other formats
+    text: str
+    sheet: Optional[int] = None   # 0-based sheet index (XLSX, XLS)
+
+def iter_segments(
+    file: BinaryIO,
+    filetype: str,
+    pdf_workers: Optional[int] = None,
+    pdf_parallel_min_pages: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> Iterator[Segment]:
+    """
+    Lazily extract a document as a sequence of non-empty text segments.
+    
+    PDFs yield one segment per page, PPTX one per slide, DOCX one per
+    paragraph, XLSX one per group of rows, XLS one per sheet and plain
+    text / Markdown one per decoded block of lines. Joining the segment
+    texts with SEGMENT_SEPARATORS[filetype] gives the same text as
+    extract_text. Empty pages and slides are skipped, but still counted, so
+    a segment's page is its real page or slide number.
     
     Args:
         file: File-like object containing the document
-        filetype: Type of the file (pdf, docx, pptx, xlsx, xls)
+        filetype: Type of the file (pdf, docx, pptx, xlsx, xls, txt, md)
+        pdf_workers: Worker processes for PDF extraction (defaults to PDF_PARALLEL_WORKERS)
+        pdf_parallel_min_pages: PDFs with fewer pages are extracted serially
+            (defaults to PDF_PARALLEL_MIN_PAGES)
+        executor: Optional process pool shared with other documents for PDF
+            and multi-sheet XLSX extraction; a pool is created per document
+            otherwise
         
-    Returns:
-        str: Extracted text from the document
+    Yields:
+        Segment: Text segments in document order
         
     Raises:
         ValueError: If the file type is not supported
@@ -30,15 +388,16 @@ def extract_text(file: BinaryIO, filetype: str) -> str:
         
         if filetype == "pdf":
             try:
-                # Open the PDF with error handling
-                doc = fitz.open(stream=file.read(), filetype="pdf")
-                # Extract text from each page
-                text_parts = []
-                for page in doc:
-                    text = page.get_text()
+                # Extract text from each page, in parallel for large documents
+                pages = _iter_pdf_pages(
+                    file.read(),
+                    workers=PDF_PARALLEL_WORKERS if pdf_workers is None else pdf_workers,
+                    min_pages=PDF_PARALLEL_MIN_PAGES if pdf_parallel_min_pages is None else pdf_parallel_min_pages,
+                    executor=executor
+                )
+                for number, text in enumerate(pages, start=1):
                     if text.strip():  # Only add non-empty pages
-                        text_parts.append(text)
-                return "\n".join(text_parts)
+                        yield Segment(number, text)
             except Exception as e:
                 logger.error(f"Error reading PDF: {str(e)}")
                 raise
@@ -46,10 +405,9 @@ def extract_text(file: BinaryIO, filetype: str) -> str:
         elif filetype == "docx":
             try:
                 doc = Document(file)
-                return "\n\n".join(
-                    p.text for p in doc.paragraphs 
-                    if p.text.strip()
-                )
+                for p in doc.paragraphs:
+                    if p.text.strip():
+                        yield Segment(None, p.text)
             except Exception as e:
                 logger.error(f"Error reading DOCX: {str(e)}")
                 raise
@@ -57,43 +415,166 @@ def extract_text(file: BinaryIO, filetype: str) -> str:
         elif filetype == "pptx":
             try:
                 prs = Presentation(file)
-                return "\n".join(
-                    shape.text for slide in prs.slides 
-                    for shape in slide.shapes 
-                    if hasattr(shape, "text") and shape.text.strip()
-                )
+                for number, slide in enumerate(prs.slides, start=1):
+                    texts = [
+                        shape.text for shape in slide.shapes
+                        if hasattr(shape, "text") and shape.text.strip()
+                    ]
+                    if texts:
+                        yield Segment(number, "\n".join(texts))
             except Exception as e:
                 logger.error(f"Error reading PPTX: {str(e)}")
                 raise
                 
-        elif filetype in ["xlsx", "xls"]:
+        elif filetype == "xlsx":
+            try:
+                for sheet, group in _iter_xlsx_groups(file.read(), SHEET_PARALLEL_WORKERS, SHEET_ROWS_PER_GROUP, executor):
+                    yield Segment(None, group, sheet)
+            except Exception as e:
+                logger.error(f"Error reading Excel file: {str(e)}")
+                raise
+            
+        elif filetype == "xls":
             try:
+                # openpyxl cannot read the legacy binary format, so fall back to pandas
                 excel_data = pd.ExcelFile(file)
-                text_parts = []
                 
-                for sheet_name in excel_data.sheet_names:
+                for index, sheet_name in enumerate(excel_data.sheet_names):
                     df = pd.read_excel(excel_data, sheet_name=sheet_name)
                     # Only include non-empty dataframes
                     if not df.empty:
-                        text_parts.append(f"--- Sheet: {sheet_name} ---")
-                        text_parts.append(df.to_string())
-                
-                return "\n\n".join(text_parts) if text_parts else ""
+                        yield Segment(None, f"--- Sheet: {sheet_name} ---\n\n{df.to_string()}", index)
                 
             except Exception as e:
                 logger.error(f"Error reading Excel file: {str(e)}")
                 raise
                 
+        elif filetype in ["txt", "md"]:
+            try:
+                for block in _iter_text_blocks(file):
+                    yield Segment(None, block)
+            except Exception as e:
+                logger.error(f"Error reading text file: {str(e)}")
+                raise
+            
         else:
             raise ValueError(f"Unsupported file type: {filetype}")
+    except Exception as e:
+        logger.error(f"Error in iter_segments: {str(e)}")
+        raise
             
+def extract_text(
+    file: BinaryIO,
+    filetype: str,
+    pdf_workers: Optional[int] = None,
+    pdf_parallel_min_pages: Optional[int] = None
+) -> str:
+    """
+    Extract text from various file formats.
+    
+    Args:
+        file: File-like object containing the document
+        filetype: Type of the file (pdf, docx, pptx, xlsx, xls, txt, md)
+        pdf_workers: Worker processes for PDF extraction (defaults to PDF_PARALLEL_WORKERS)
+        pdf_parallel_min_pages: PDFs with fewer pages are extracted serially
+            (defaults to PDF_PARALLEL_MIN_PAGES)
+        
+    Returns:
+        str: Extracted text from the document
+        
+    Raises:
+        ValueError: If the file type is not supported
+        Exception: For any other errors during text extraction
+    """
+    try:
+        segments = iter_segments(file, filetype, pdf_workers, pdf_parallel_min_pages)
+        return SEGMENT_SEPARATORS.get(filetype, "\n").join(segment.text for segment in segments)
     except Exception as e:
         logger.error(f"Error in extract_text: {str(e)}")
         raise
 
+class Span(NamedTuple):
+    """A chunk as a [start, end) character range over its source text"""
+    start: int
+    end: int
+    page: int
+
+def split_spans(
+    text: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    page_starts: Optional[Sequence[int]] = None,
+    separators: Sequence[str] = CHUNK_SEPARATORS
+) -> List[Span]:
+    """
+    Split text into overlapping chunks, returned as offsets into the text.
+    
+    Each chunk is cut at the highest-priority separator found in the second
+    half of its window, falling back to a hard cut when none is present.
+    Consecutive chunks overlap by up to chunk_overlap characters, starting
+    on a word boundary. The text is scanned once, so the cost is linear in
+    its length and no chunk text is copied.
+    
+    Args:
+        text: The text to split
+        chunk_size: Maximum size of each chunk (in characters)
+        chunk_overlap: Number of characters to overlap between chunks
+        page_starts: Optional sorted offsets at which each page (or other
+            segment) of the text starts
+        separators: Break points in priority order
+        
+    Returns:
+        List[Span]: Chunk offsets in text order; page is the index in
+            page_starts of the page each chunk starts on (0 without page_starts)
+    """
+    n = len(text)
+    min_fill = chunk_size // 2
+    spans: List[Span] = []
+    
+    start = 0
+    while start < n and text[start].isspace():
+        start += 1
+    
+    while start < n:
+        limit = start + chunk_size
+        if limit >= n:
+            cut = end = n
+        else:
+            cut = end = limit
+            for sep in separators:
+                idx = text.rfind(sep, start + min_fill, limit)
+                if idx != -1:
+                    # Keep punctuation such as the "." of ". " with the chunk
+                    cut = end = idx + len(sep.rstrip())
+                    break
+        
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        page = bisect_right(page_starts, start) - 1 if page_starts else 0
+        spans.append(Span(start, end, max(page, 0)))
+        
+        if cut >= n:
+            break
+        
+        # Step back by the overlap, then forward to the next word boundary
+        next_start = end - chunk_overlap
+        if next_start <= start:
+            next_start = cut
+        else:
+            boundary = next_start
+            while boundary < end and not text[boundary - 1].isspace():
+                boundary += 1
+            if boundary < end:
+                next_start = boundary
+        while next_start < n and text[next_start].isspace():
+            next_start += 1
+        start = max(next_start, start + 1)
+    
+    return spans
+
 def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
     """
-    Split text into chunks using a recursive character text splitter.
+    Split text into chunks using split_spans.
     
     Args:
         text: The text to split
@@ -107,16 +588,83 @@ def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> L
         if not text or not text.strip():
             return []
             
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        
-        return splitter.split_text(text)
+        return [text[span.start:span.end] for span in split_spans(text, chunk_size, chunk_overlap)]
         
     except Exception as e:
         logger.error(f"Error in split_text: {str(e)}")
         # Fallback to simple splitting if the smart splitter fails
         return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+class Chunk(NamedTuple):
+    """A chunk of a document and where it starts"""
+    text: str
+    page: Optional[int]   # Page or slide number of the segment the chunk starts in
+    sheet: Optional[int]  # Sheet index of that segment
+    start: int            # Character offset in the extracted text
+
+def iter_chunks(
+    segments: Iterable[Segment],
+    separator: str = "\n",
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200
+) -> Iterator[Chunk]:
+    """
+    Split a stream of text segments into chunks as the segments arrive.
+    
+    Segments are buffered until the buffer holds roughly
+    CHUNK_WINDOW_MULTIPLIER chunks, which are then split with split_spans.
+    Every chunk but the last is materialized and emitted; the text from the
+    last chunk's start onwards is carried over, since it may continue in
+    the next segment. Memory is bounded by the window size (or the largest
+    single segment), not by the document size.
+    
+    Args:
+        segments: Text segments in document order
+        separator: String placed between consecutive segments
+        chunk_size: Maximum size of each chunk (in characters)
+        chunk_overlap: Number of characters to overlap between chunks
+        
+    Yields:
+        Chunk: Chunk text, the page and sheet of the segment it starts in,
+            and its character offset in the segment texts joined by
+            separator
+    """
+    window = chunk_size * CHUNK_WINDOW_MULTIPLIER
+    parts: List[str] = []
+    starts: List[int] = []  # Offset of each buffered segment in the joined buffer
+    sources: List[Segment] = []  # Each buffered segment, without its text
+    buffered = 0
+    origin = 0              # Document offset of the start of the buffer
+    
+    def flush(final: bool) -> Iterator[Chunk]:
+        nonlocal parts, starts, sources, buffered, origin
+        buffer = separator.join(parts)
+        spans = split_spans(buffer, chunk_size, chunk_overlap, page_starts=starts)
+        emit = spans if final or len(spans) < 2 else spans[:-1]
+        for span in emit:
+            source = sources[span.page]
+            yield Chunk(buffer[span.start:span.end], source.page, source.sheet, origin + span.start)
+        if final or len(spans) < 2:
+            parts, starts, sources, buffered = [], [], [], 0
+            origin += len(buffer) + len(separator)
+            return
+        
+        # Carry the tail of the buffer, keeping track of which segments it spans
+        cut = spans[-1].start
+        origin += cut
+        kept = [i for i, offset in enumerate(starts) if offset > cut]
+        parts = [buffer[cut:]]
+        sources = [sources[spans[-1].page]] + [sources[i] for i in kept]
+        starts = [0] + [starts[i] - cut for i in kept]
+        buffered = len(parts[0]) + len(separator)
+    
+    for segment in segments:
+        starts.append(buffered)
+        sources.append(segment._replace(text=""))
+        parts.append(segment.text)
+        buffered += len(segment.text) + len(separator)
+        if buffered >= window:
+            yield from flush(final=False)
+    
+    if parts:
+        yield from flush(final=True)
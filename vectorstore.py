@@ -1,88 +1,736 @@
 import os
+import time
+import uuid
+import pickle
+import asyncio
+import threading
+import weakref
+import functools
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 import numpy as np
-from typing import List, Dict, Any, Optional
+import faiss
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Deque, Tuple, Callable
 from dotenv import load_dotenv
 import cohere
+import httpx
 from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings
+from embedding_cache import CachedEmbeddings
+from metrics import embedding_metrics
+from local_embeddings import HashingEmbeddings
+from embedding_control import (
+    COHERE_MAX_BATCH_SIZE,
+    EMBED_MAX_IN_FLIGHT,
+    EmbeddingController,
+    embedding_controller
+)
+from quantization import EMBEDDING_TYPE, RESCORE_FACTOR, check_embedding_type, quantize, EMBEDDING_DTYPES, create_index, QuantizedFAISS, is_quantized, merge_docstores
+from reduction import REDUCTION, REDUCTION_DIMENSIONS, REDUCTION_MEASURE_RECALL, Projection, ReducedFAISS, global_projection, measure_recall, is_reduced
+from bm25 import BM25Index
+from columnar_docstore import ColumnarDocstore
+from index_factory import INDEX_TYPE, INDEX_RECALL_TARGET, choose_index, build_index, tune_search, mmap_flags, save_index_spec, load_index_spec
 
 # Load environment variables
 load_dotenv()
 
+DEFAULT_EMBED_MODEL = "embed-english-v3.0"
+
+# Embeddings backend used when none is passed in (see EMBEDDINGS_BACKENDS)
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "cohere")
+
+# Whether default embeddings go through the persistent embedding cache
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") != "0"
+
+# Keep-alive connection pool shared by all Cohere clients in the process
+COHERE_MAX_CONNECTIONS = int(os.getenv("COHERE_MAX_CONNECTIONS", 32))
+COHERE_MAX_KEEPALIVE = int(os.getenv("COHERE_MAX_KEEPALIVE", 16))
+COHERE_KEEPALIVE_EXPIRY = float(os.getenv("COHERE_KEEPALIVE_EXPIRY", 60))
+
+# In-process query embedding cache settings
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings with a time-to-live.
+    
+    A single module-level instance is shared by every embeddings object in
+    the process, and therefore by every Streamlit session.
+    """
+    
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize a query so trivially different spellings share an entry"""
+        return " ".join(text.split()).casefold()
+    
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return the cached embedding of text, or None if missing or expired"""
+        key = (model, self.normalize(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                embedding_metrics.increment("query_cache_misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            embedding_metrics.increment("query_cache_hits")
+            return list(entry[1])
+    
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        """Cache the embedding of text, evicting the least recently used entry if full"""
+        key = (model, self.normalize(text))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(embedding))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop every cached query embedding"""
+        with self._lock:
+            self._entries.clear()
+
+_query_cache = QueryEmbeddingCache()
+
+_client_lock = threading.Lock()
+_clients: Dict[Optional[str], cohere.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Optional[str], cohere.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=COHERE_MAX_CONNECTIONS,
+        max_keepalive_connections=COHERE_MAX_KEEPALIVE,
+        keepalive_expiry=COHERE_KEEPALIVE_EXPIRY
+    )
+
+def get_cohere_client(api_key: Optional[str] = None) -> cohere.Client:
+    """
+    Return the process-wide Cohere client for api_key.
+    
+    The client is created on first use and reuses one keep-alive HTTP
+    connection pool across every embeddings object, session and thread.
+    """
+    with _client_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # Retries are left to the embedding controller so it sees rate limits
+            client = cohere.Client(api_key=api_key, max_retries=0, httpx_client=httpx.Client(limits=_http_limits()))
+            _clients[api_key] = client
+        return client
+
+def get_async_cohere_client(api_key: Optional[str] = None) -> cohere.AsyncClient:
+    """
+    Return the async Cohere client for api_key on the running event loop.
+    
+    Async HTTP connections belong to the loop that opened them, so there
+    is one pooled client per event loop, shared by every coroutine on it.
+    
+    Raises:
+        RuntimeError: If called outside a running event loop
+    """
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            client = cohere.AsyncClient(api_key=api_key, max_retries=0, httpx_client=httpx.AsyncClient(limits=_http_limits()))
+            clients[api_key] = client
+        return client
+
+# Cohere's name for each embedding type
+_COHERE_EMBEDDING_TYPES = {"float": "float", "int8": "int8", "binary": "ubinary"}
+
 class DirectCohereEmbeddings(Embeddings):
     """Custom embeddings class that uses Cohere client directly"""
     
-    def __init__(self, model: str = "embed-english-v3.0"):
+    # Embedding types the API can return directly
+    embedding_types = ("float", "int8", "binary")
+    
+    def __init__(self, model: str = DEFAULT_EMBED_MODEL):
         self.model = model
-        self.client = cohere.Client(api_key=os.getenv("COHERE_API_KEY"))
+        self.api_key = os.getenv("COHERE_API_KEY")
+        self.client = get_cohere_client(self.api_key)
     
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed a list of documents using Cohere"""
+    @staticmethod
+    def _to_array(response: Any, embedding_type: str) -> np.ndarray:
+        """Convert an embed response into an array of the requested type"""
+        if embedding_type == "float":
+            return np.asarray(response.embeddings.float_, dtype=np.float32)
+        cohere_type = _COHERE_EMBEDDING_TYPES[embedding_type]
+        return np.asarray(getattr(response.embeddings, cohere_type), dtype=EMBEDDING_DTYPES[embedding_type])
+    
+    @embedding_metrics.tracked
+    def embed_documents_array(self, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+        """Embed a list of documents using Cohere, as a float32, int8 or packed uint8 (binary) array"""
+        check_embedding_type(embedding_type)
         try:
             response = self.client.embed(
                 texts=texts,
                 model=self.model,
-                input_type="search_document"
+                input_type="search_document",
+                embedding_types=[_COHERE_EMBEDDING_TYPES[embedding_type]]
             )
-            return [list(embedding) for embedding in response.embeddings]
+            return self._to_array(response, embedding_type)
         except Exception as e:
             print(f"Error in embed_documents: {str(e)}")
             raise
     
+    @embedding_metrics.tracked
+    async def aembed_documents_array(self, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+        """Asynchronously embed a list of documents on the event loop's pooled client"""
+        check_embedding_type(embedding_type)
+        try:
+            response = await get_async_cohere_client(self.api_key).embed(
+                texts=texts,
+                model=self.model,
+                input_type="search_document",
+                embedding_types=[_COHERE_EMBEDDING_TYPES[embedding_type]]
+            )
+            return self._to_array(response, embedding_type)
+        except Exception as e:
+            print(f"Error in aembed_documents: {str(e)}")
+            raise
+    
+    # embed_documents_array makes exactly one request (embed_batches wraps it
+    # in the controller); the methods below retry through the controller too
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents using Cohere, retrying transient failures"""
+        if not texts:
+            return []
+        return embedding_controller.call(self.embed_documents_array, texts).tolist()
+    
     def embed_query(self, text: str) -> List[float]:
-        """Embed a single query using Cohere"""
-        return self.embed_documents([text])[0]
+        """Embed a single query using Cohere, reusing recent identical queries"""
+        embedding = _query_cache.get(self.model, text)
+        if embedding is None:
+            embedding = embedding_controller.call(self.embed_documents_array, [text], queue=False)[0].tolist()
+            _query_cache.put(self.model, text, embedding)
+        return embedding
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronously embed a list of documents using Cohere, retrying transient failures"""
+        if not texts:
+            return []
+        return (await embedding_controller.acall(self.aembed_documents_array, texts)).tolist()
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronously embed a single query, reusing recent identical queries"""
+        embedding = _query_cache.get(self.model, text)
+        if embedding is None:
+            embedding = (await embedding_controller.acall(self.aembed_documents_array, [text], queue=False))[0].tolist()
+            _query_cache.put(self.model, text, embedding)
+        return embedding
+
+# Registered embeddings backends: name -> factory taking backend options
+EMBEDDINGS_BACKENDS: Dict[str, Callable[..., Embeddings]] = {
+    "cohere": DirectCohereEmbeddings,
+    "hashing": HashingEmbeddings
+}
+
+# Embeddings returned by get_default_embeddings, by backend name
+_default_embeddings_lock = threading.Lock()
+_default_embeddings: Dict[str, Embeddings] = {}
+
+def register_embeddings_backend(name: str, factory: Callable[..., Embeddings]) -> None:
+    """Make an embeddings backend selectable by name, e.g. via EMBEDDINGS_BACKEND"""
+    EMBEDDINGS_BACKENDS[name] = factory
+    # Drop default embeddings created by a factory registered under the same name
+    with _default_embeddings_lock:
+        _default_embeddings.pop(name, None)
+
+def create_embeddings(backend: Optional[str] = None, **options: Any) -> Embeddings:
+    """
+    Create embeddings from a registered backend.
+    
+    Args:
+        backend: Backend name (defaults to EMBEDDINGS_BACKEND): "cohere" for
+            the Cohere API or "hashing" for the local HashingEmbeddings
+        **options: Passed to the backend's factory (e.g. model, dimensions)
+    
+    Returns:
+        Embeddings: A new embeddings instance
+    
+    Raises:
+        ValueError: If the backend is not registered
+    """
+    backend = backend or EMBEDDINGS_BACKEND
+    factory = EMBEDDINGS_BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown embeddings backend: {backend} (available: {', '.join(sorted(EMBEDDINGS_BACKENDS))})")
+    return factory(**options)
+
+def get_default_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Return the process-wide embeddings used when none are passed in.
+    
+    The embeddings are created on first use per backend and shared by
+    every session and thread, so the embedding cache's SQLite connection
+    and entry count are set up once per process.
+    
+    Args:
+        backend: Backend name (defaults to EMBEDDINGS_BACKEND)
+    
+    Returns:
+        Embeddings: The backend's embeddings, wrapped in CachedEmbeddings
+            unless EMBED_CACHE is disabled or the backend runs locally
+    """
+    backend = backend or EMBEDDINGS_BACKEND
+    with _default_embeddings_lock:
+        embeddings = _default_embeddings.get(backend)
+        if embeddings is None:
+            embeddings = create_embeddings(backend)
+            if EMBED_CACHE and not getattr(embeddings, "local", False):
+                embeddings = CachedEmbeddings(embeddings)
+            _default_embeddings[backend] = embeddings
+        return embeddings
+
+def chunk_metadatas(
+    count: int,
+    file: Optional[str] = None,
+    pages: Optional[List[Optional[int]]] = None,
+    char_starts: Optional[List[int]] = None,
+    texts: Optional[List[str]] = None,
+    sheets: Optional[List[Optional[int]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build the metadata dicts stored with each chunk.
+    
+    Args:
+        count: Number of chunks
+        file: Optional name of the file the chunks came from
+        pages: Optional page or slide number of each chunk (None for
+            formats without pages)
+        char_starts: Optional character offset of each chunk in the extracted
+            text; stored with the chunk's end as "char_start" / "char_end"
+        texts: Chunk texts, required with char_starts
+        sheets: Optional sheet index of each chunk (None outside spreadsheets)
+    
+    Returns:
+        List[Dict[str, Any]]: One metadata dict per chunk
+    """
+    metadatas = [{"source": f"chunk-{j}"} for j in range(count)]
+    if file is not None:
+        for metadata in metadatas:
+            metadata["file"] = file
+    if pages is not None:
+        for metadata, page in zip(metadatas, pages):
+            if page is not None:
+                metadata["page"] = page
+    if char_starts is not None:
+        for metadata, start, text in zip(metadatas, char_starts, texts):
+            metadata["char_start"] = start
+            metadata["char_end"] = start + len(text)
+    if sheets is not None:
+        for metadata, sheet in zip(metadatas, sheets):
+            if sheet is not None:
+                metadata["sheet"] = sheet
+    return metadatas
+
+def embed_array(embeddings: Embeddings, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+    """
+    Embed texts as an array with one row per text.
+    
+    Uses the embeddings' embed_documents_array when available, so vectors
+    go straight from the API response into one contiguous array without
+    a round trip through Python lists of floats. int8 and binary
+    embeddings are requested from embedders that list the type in their
+    embedding_types and quantized locally from floats otherwise.
+    """
+    if embedding_type != "float":
+        if embedding_type in getattr(embeddings, "embedding_types", ()):
+            return embeddings.embed_documents_array(texts, embedding_type)
+        return quantize(embed_array(embeddings, texts), embedding_type)
+    if hasattr(embeddings, "embed_documents_array"):
+        return embeddings.embed_documents_array(texts)
+    return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+async def aembed_array(embeddings: Embeddings, texts: List[str], embedding_type: str = "float") -> np.ndarray:
+    """Async counterpart of embed_array"""
+    if embedding_type != "float":
+        if embedding_type in getattr(embeddings, "embedding_types", ()):
+            return await embeddings.aembed_documents_array(texts, embedding_type)
+        return quantize(await aembed_array(embeddings, texts), embedding_type)
+    if hasattr(embeddings, "aembed_documents_array"):
+        return await embeddings.aembed_documents_array(texts)
+    return np.asarray(await embeddings.aembed_documents(texts), dtype=np.float32)
+
+def batched(texts: List[str], batch_size: int) -> Iterator[List[str]]:
+    """Split texts into consecutive batches of at most batch_size"""
+    for i in range(0, len(texts), batch_size):
+        yield texts[i:i + batch_size]
+
+def embed_batches(
+    embeddings: Embeddings,
+    batches: Iterable[List[str]],
+    max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    embedding_type: str = "float",
+    controller: Optional[EmbeddingController] = None
+) -> np.ndarray:
+    """
+    Embed batches of texts with several requests in flight at once.
+    
+    Batches are pulled lazily from the iterable, so it can be a stream that
+    is still being produced. The controller sets how many requests run at
+    a time across the whole process (this call never runs more than
+    max_in_flight) and may split a batch into smaller requests; when the
+    limit is reached the oldest request is awaited before the next batch
+    is submitted. Rate limits, server errors
+    and timeouts are retried with backoff instead of failing the ingest.
+    
+    Args:
+        embeddings: Embeddings used for the texts
+        batches: Batches of texts, each embedded in one or more requests
+        max_in_flight: Maximum number of concurrent embedding requests
+        embedding_type: "float", "int8" or "binary"
+        controller: Adaptive batch size/concurrency controller (defaults to
+            the shared embedding_controller)
+    
+    Returns:
+        np.ndarray: Array with one row per text in input order, of
+            EMBEDDING_DTYPES[embedding_type]
+    """
+    controller = controller or embedding_controller
+    embed = functools.partial(embed_array, embeddings, embedding_type=embedding_type)
+    results: List[np.ndarray] = []
+    pending: Deque[Future] = deque()
+    
+    def collect(future: Future) -> None:
+        results.append(future.result())
+        print(f"Embedded batch {len(results)} ({sum(len(r) for r in results)} chunks so far)")
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as executor:
+        try:
+            for batch in batches:
+                while len(pending) >= min(controller.in_flight, max_in_flight):
+                    collect(pending.popleft())
+                pending.append(executor.submit(controller.call, embed, batch))
+            while pending:
+                collect(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    print(f"Embedding controller: {controller.settings()}")
+    if not results:
+        return np.empty((0, 0), dtype=EMBEDDING_DTYPES[embedding_type])
+    return np.vstack(results)
+
+async def aembed_batches(
+    embeddings: Embeddings,
+    batches: Iterable[List[str]],
+    max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    embedding_type: str = "float",
+    controller: Optional[EmbeddingController] = None
+) -> np.ndarray:
+    """
+    Embed batches of texts concurrently on the current event loop.
+    
+    Async counterpart of embed_batches: requests wait on the network
+    without holding a thread each, and share the loop's pooled client
+    with any other coroutines (e.g. other sessions) running on it.
+    
+    Args:
+        embeddings: Embeddings used for the texts
+        batches: Batches of texts, each embedded in one or more requests
+        max_in_flight: Maximum number of concurrent embedding requests
+        embedding_type: "float", "int8" or "binary"
+        controller: Adaptive batch size/concurrency controller (defaults to
+            the shared embedding_controller)
+    
+    Returns:
+        np.ndarray: Array with one row per text in input order, of
+            EMBEDDING_DTYPES[embedding_type]
+    """
+    controller = controller or embedding_controller
+    embed = functools.partial(aembed_array, embeddings, embedding_type=embedding_type)
+    slots = asyncio.Condition()
+    active = 0
+    
+    async def run(batch: List[str]) -> np.ndarray:
+        nonlocal active
+        async with slots:
+            await slots.wait_for(lambda: active < min(controller.in_flight, max_in_flight))
+            active += 1
+        try:
+            return await controller.acall(embed, batch)
+        finally:
+            async with slots:
+                active -= 1
+                slots.notify_all()
+    
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    print(f"Embedded {len(results)} batches ({sum(len(r) for r in results)} chunks)")
+    
+    if not results:
+        return np.empty((0, 0), dtype=EMBEDDING_DTYPES[embedding_type])
+    return np.vstack(results)
+
+def fit_projection(vectors: np.ndarray, reduction: str) -> Optional[Projection]:
+    """
+    Return the projection used to reduce vectors.
+    
+    The REDUCTION_PROJECTION one if configured, otherwise one fitted to
+    vectors; None if REDUCTION_DIMENSIONS does not reduce them.
+    
+    Raises:
+        ValueError: If PCA is fitted to fewer vectors than REDUCTION_DIMENSIONS
+    """
+    projection = global_projection()
+    if projection is None and REDUCTION_DIMENSIONS < vectors.shape[1]:
+        projection = Projection.fit(vectors, reduction, REDUCTION_DIMENSIONS)
+    return projection
+
+def create_vectorstore(
+    texts: List[str],
+    vectors: np.ndarray,
+    metadatas: List[Dict[str, Any]],
+    embeddings: Embeddings,
+    embedding_type: str = "float",
+    rescore_factor: int = RESCORE_FACTOR,
+    reduction: str = "none",
+    projection: Optional[Projection] = None,
+    index_type: str = "flat",
+    recall_target: float = INDEX_RECALL_TARGET
+) -> FAISS:
+    """
+    Build a FAISS vector store in one step from precomputed vectors.
+    
+    Args:
+        texts: Chunk texts
+        vectors: Array with one row per text, as returned by embed_batches
+        metadatas: One metadata dict per text
+        embeddings: Embeddings used for queries against the store
+        embedding_type: Type of vectors: "float", "int8" or "binary"
+        rescore_factor: Candidates per result rescored with the float query
+            (compressed types only; 0 disables rescoring) or with the full
+            vectors (reduced stores)
+        reduction: "none", or "pca" / "random" to search float vectors in
+            REDUCTION_DIMENSIONS dimensions and rescore with full vectors
+            memory-mapped from disk
+        projection: Fitted projection to use instead of the REDUCTION_PROJECTION
+            one or one fitted to these vectors
+        index_type: "flat", "ivf", "hnsw" or "auto" for float and reduced
+            vectors (see choose_index); compressed vectors are always searched
+            exhaustively
+        recall_target: Recall the approximate index types are tuned for
+    
+    Returns:
+        FAISS: A FAISS vector store containing the texts; a QuantizedFAISS
+            for int8 and binary vectors, a ReducedFAISS when reduced. The
+            chosen index is described by its index_spec attribute, and a
+            BM25 index over the texts is attached as its bm25 attribute.
+    
+    Raises:
+        ValueError: If reduction is combined with compressed embeddings
+    """
+    ids = [str(uuid.uuid4()) for _ in texts]
+    docstore = ColumnarDocstore.from_texts(ids, texts, metadatas)
+    
+    if reduction != "none":
+        if embedding_type != "float":
+            raise ValueError("Dimensionality reduction requires float embeddings")
+        projection = projection or fit_projection(vectors, reduction)
+    
+    if projection is not None and reduction != "none":
+        spec = choose_index(len(vectors), projection.dimensions, index_type, recall_target)
+        vectorstore = ReducedFAISS.from_vectors(
+            embeddings, vectors, docstore, dict(enumerate(ids)), projection, rescore_factor, spec
+        )
+        vectorstore.index_spec = spec
+        if REDUCTION_MEASURE_RECALL:
+            vectorstore.reduction_stats = measure_recall(vectorstore)
+            print(f"Reduced vectors: {vectorstore.reduction_stats}")
+    elif embedding_type != "float":
+        vectorstore = QuantizedFAISS(
+            embeddings,
+            create_index(vectors, embedding_type),
+            docstore,
+            dict(enumerate(ids)),
+            embedding_type=embedding_type,
+            rescore_factor=rescore_factor
+        )
+    else:
+        spec = choose_index(len(vectors), vectors.shape[1], index_type, recall_target)
+        vectorstore = FAISS(
+            embedding_function=embeddings,
+            index=build_index(vectors, spec),
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids))
+        )
+        vectorstore.index_spec = spec
+    
+    # Sparse index over the same positions, for hybrid retrieval
+    vectorstore.bm25 = BM25Index.from_texts(texts)
+    return vectorstore
+
+def merge_vectorstores(vectorstore: FAISS, *others: FAISS) -> None:
+    """
+    Merge others into vectorstore, in order, along with their BM25 indexes.
+    
+    The BM25 indexes are merged in one pass after all the stores, so
+    merging many files does not rebuild the combined index once per file.
+    If any store has no BM25 index, the merged store is left without one
+    and gets it rebuilt on first hybrid search.
+    """
+    indexes = [getattr(store, "bm25", None) for store in (vectorstore, *others)]
+    for other in others:
+        if type(vectorstore) is FAISS and isinstance(vectorstore.docstore, ColumnarDocstore):
+            starting_len = len(vectorstore.index_to_docstore_id)
+            vectorstore.index.merge_from(other.index)
+            merge_docstores(vectorstore, other, starting_len)
+        else:
+            vectorstore.merge_from(other)
+    if any(index is None for index in indexes):
+        vectorstore.bm25 = None
+    elif others:
+        vectorstore.bm25 = BM25Index.merge_all(indexes)
+
+def reindex_vectorstore(
+    vectorstore: FAISS,
+    index_type: str = INDEX_TYPE,
+    recall_target: float = INDEX_RECALL_TARGET
+) -> FAISS:
+    """
+    Rebuild a flat store's index as the type chosen for its final size.
+    
+    Stores are built and merged with flat indexes (IVF lists trained on
+    different documents cannot be merged, and HNSW graphs cannot be merged
+    at all), then reindexed once the whole library is known. Compressed
+    stores and stores whose index is not flat are returned unchanged.
+    
+    Args:
+        vectorstore: Float or reduced vector store with a flat index
+        index_type: "flat", "ivf", "hnsw" or "auto" (see choose_index)
+        recall_target: Recall the approximate index types are tuned for
+    
+    Returns:
+        FAISS: The same store, with its index replaced if needed
+    """
+    if isinstance(vectorstore, QuantizedFAISS) or not isinstance(vectorstore.index, faiss.IndexFlat):
+        return vectorstore
+    
+    index = vectorstore.index
+    spec = choose_index(index.ntotal, index.d, index_type, recall_target)
+    if spec["type"] != "flat":
+        start = time.perf_counter()
+        vectorstore.index = build_index(index.reconstruct_n(0, index.ntotal), spec)
+        print(f"Rebuilt index as {spec['type']} in {time.perf_counter() - start:.1f}s: {spec}")
+    vectorstore.index_spec = spec
+    return vectorstore
 
-def build_vectorstore(chunks: List[str]) -> FAISS:
+def reduce_vectorstore(
+    vectorstore: FAISS,
+    reduction: str,
+    index_type: str = INDEX_TYPE,
+    recall_target: float = INDEX_RECALL_TARGET,
+    rescore_factor: int = RESCORE_FACTOR
+) -> FAISS:
+    """
+    Reduce a merged float store with one projection fitted over all of it.
+    
+    Multi-document libraries are built unreduced and reduced here, so a
+    PCA is fitted to the whole library rather than to whichever document
+    happened to come first.
+    
+    Args:
+        vectorstore: Float vector store with a flat index
+        reduction: "pca" or "random"
+        index_type: "flat", "ivf", "hnsw" or "auto" (see choose_index)
+        recall_target: Recall the approximate index types are tuned for
+        rescore_factor: Candidates per result rescored with the full vectors
+    
+    Returns:
+        FAISS: A ReducedFAISS over the same documents, or the store
+            unchanged (reindexed) if REDUCTION_DIMENSIONS does not reduce it
+    
+    Raises:
+        ValueError: If the store is compressed, or PCA gets too few vectors
+    """
+    if isinstance(vectorstore, QuantizedFAISS):
+        raise ValueError("Dimensionality reduction requires float embeddings")
+    
+    index = vectorstore.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    projection = fit_projection(vectors, reduction)
+    if projection is None:
+        return reindex_vectorstore(vectorstore, index_type, recall_target)
+    
+    spec = choose_index(len(vectors), projection.dimensions, index_type, recall_target)
+    reduced = ReducedFAISS.from_vectors(
+        vectorstore.embedding_function, vectors, vectorstore.docstore,
+        vectorstore.index_to_docstore_id, projection, rescore_factor, spec
+    )
+    reduced.index_spec = spec
+    reduced.bm25 = getattr(vectorstore, "bm25", None)
+    if REDUCTION_MEASURE_RECALL:
+        reduced.reduction_stats = measure_recall(reduced)
+        print(f"Reduced vectors: {reduced.reduction_stats}")
+    return reduced
+
+def build_vectorstore(
+    chunks: List[str],
+    embeddings: Optional[Embeddings] = None,
+    embedding_type: str = EMBEDDING_TYPE,
+    reduction: str = REDUCTION,
+    index_type: str = INDEX_TYPE
+) -> FAISS:
     """
     Build a FAISS vector store from text chunks using Cohere embeddings.
     
     Args:
         chunks: List of text chunks to be embedded and stored
-        
+        embeddings: Embeddings to use instead of the EMBEDDINGS_BACKEND default
+        embedding_type: "float", or "int8" / "binary" for a compressed index
+            (4x / 32x smaller)
+        reduction: "none", or "pca" / "random" to search in fewer dimensions
+        index_type: "auto" to pick flat, IVF or HNSW from the number of
+            chunks and INDEX_RECALL_TARGET, or one of them explicitly
+    
     Returns:
         FAISS: A FAISS vector store containing the embedded chunks
     """
     try:
-        print("Initializing Cohere embeddings...")
-        
-        # Initialize our custom embeddings
-        embeddings = DirectCohereEmbeddings()
+        if embeddings is None:
+            print(f"Initializing {EMBEDDINGS_BACKEND} embeddings...")
+            
+            # Initialize our custom embeddings
+            embeddings = get_default_embeddings()
         
         print(f"Creating FAISS vector store with {len(chunks)} chunks...")
         
-        # Process in smaller batches to avoid timeouts
-        batch_size = 10
-        vectorstore = None
+        if not chunks:
+            raise ValueError("No documents were processed - vector store is empty")
         
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(chunks) + batch_size - 1) // batch_size
-            print(f"Processing batch {batch_num}/{total_batches} ({len(batch)} chunks)")
-            
-            if vectorstore is None:
-                # First batch - create new vector store
-                vectorstore = FAISS.from_texts(
-                    texts=batch,
-                    embedding=embeddings,
-                    metadatas=[{"source": f"chunk-{j}"} for j in range(i, min(i + batch_size, len(chunks)))]
-                )
-                print(f"Created new vector store with batch {batch_num}")
-            else:
-                # Subsequent batches - add to existing vector store
-                vectorstore.add_texts(
-                    texts=batch,
-                    metadatas=[{"source": f"chunk-{j}"} for j in range(i, min(i + batch_size, len(chunks)))]
-                )
-                print(f"Added batch {batch_num} to vector store")
+        # Embed in the largest batches the API accepts, several at a time,
+        # then build the index once from all of the vectors
+        total_batches = (len(chunks) + COHERE_MAX_BATCH_SIZE - 1) // COHERE_MAX_BATCH_SIZE
+        print(f"Embedding {total_batches} batches of up to {COHERE_MAX_BATCH_SIZE} chunks")
+        start = time.perf_counter()
+        vectors = embed_batches(embeddings, batched(chunks, COHERE_MAX_BATCH_SIZE), embedding_type=embedding_type)
+        embedding_metrics.observe_stage("embed", time.perf_counter() - start)
+        start = time.perf_counter()
+        vectorstore = create_vectorstore(
+            chunks, vectors, chunk_metadatas(len(chunks)), embeddings, embedding_type,
+            reduction=reduction, index_type=index_type
+        )
+        embedding_metrics.observe_stage("index_build", time.perf_counter() - start)
         
-        if vectorstore is None:
-            raise ValueError("No documents were processed - vector store is empty")
-            
         print("Successfully created vector store with all chunks")
         return vectorstore
-        
+    
     except Exception as e:
         print(f"Error in build_vectorstore: {str(e)}")
         print(f"Error type: {type(e).__name__}")
@@ -90,3 +738,68 @@ def build_vectorstore(chunks: List[str]) -> FAISS:
             import traceback
             traceback.print_exc()
         raise
+
+def save_vectorstore(vectorstore: FAISS, folder_path: str) -> None:
+    """
+    Save a vector store with save_local, plus the spec of its index and its BM25 index.
+    
+    Args:
+        vectorstore: Store to save
+        folder_path: Directory to save it to
+    """
+    vectorstore.save_local(folder_path)
+    spec = getattr(vectorstore, "index_spec", None)
+    if spec is not None:
+        save_index_spec(folder_path, spec)
+    bm25 = getattr(vectorstore, "bm25", None)
+    if bm25 is not None:
+        bm25.save(folder_path)
+
+def load_vectorstore(folder_path: str, embeddings: Embeddings, mmap: bool = False) -> FAISS:
+    """
+    Load a vector store saved with save_vectorstore: flat, compressed or reduced.
+    
+    Only use on directories written by this application: loading unpickles
+    the docstore.
+    
+    Args:
+        folder_path: Directory the store was saved to
+        embeddings: Embeddings attached to the loaded store for queries
+        mmap: Memory-map the index from disk instead of reading it, so opening
+            is near-instant and pages are read on demand. The store is then
+            read-only: never add to it or merge into it.
+    
+    Returns:
+        FAISS: The loaded store, of the class that saved it
+    """
+    spec = load_index_spec(folder_path)
+    io_flags = mmap_flags(spec and spec.get("type")) if mmap else 0
+    
+    if is_reduced(folder_path):
+        vectorstore = ReducedFAISS.load_local(
+            folder_path, embeddings, allow_dangerous_deserialization=True, io_flags=io_flags
+        )
+    elif is_quantized(folder_path):
+        vectorstore = QuantizedFAISS.load_local(
+            folder_path, embeddings, allow_dangerous_deserialization=True, io_flags=io_flags
+        )
+    elif mmap:
+        # FAISS.load_local always reads the whole index into memory
+        index = faiss.read_index(os.path.join(folder_path, "index.faiss"), io_flags)
+        with open(os.path.join(folder_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vectorstore = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+    else:
+        vectorstore = FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True)
+    
+    # Search parameters are not part of the serialized index
+    if spec is not None:
+        vectorstore.index_spec = spec
+        tune_search(vectorstore, spec.get("nprobe"), spec.get("ef_search"))
+    vectorstore.bm25 = BM25Index.load(folder_path, mmap)
+    return vectorstore